@@ -7,11 +7,18 @@ VincentNL 2026
 
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, colorchooser
-import struct, json, re
+import re
 from pathlib import Path
+import multiprocessing
 import os
 import sys
 
+from ninjasubs import cache, compiler, journal, project, runtime, scanner, subfile, wrap
+from ninjasubs.track import Subtitle, SubtitleTrack
+
+# Field edits arriving within this window are applied as one update (about a frame)
+EDIT_COALESCE_MS = 20
+
 
 class njSubs_Editor:
 
@@ -30,29 +37,35 @@ class njSubs_Editor:
         icon_path = self.resource_path("ninja.ico")
         self.root.iconbitmap(icon_path)
         self.root.resizable(False, False)
-        self.scenes = {0: []}
+        self.scenes = {0: SubtitleTrack()}
         self.scene_names = {0: "None"}
         self.current_scene = 0
         self.project_loaded = False
         self.clipboard_data = None
         self.updating_fields = False
-        self.asm_settings = {
-            'game_binary': '', 'executable_base_offset': '0x8c010000',
-            'empty_space_offset': '0x8C010000', 'empty_space_end': '0x00000000',
-            'njprint_offset': '0x8C010000',
-            'njprint_color_offset': '0x8C010000',
-            'timer_offset': '0x8C010000', 'base_color_argb': 'ffbfbfbf',
-            'game_fps': '60', 'backup_executable': True, 'ignore_font_fix': False
-        }
+        self.asm_settings = dict(project.DEFAULT_ASM_SETTINGS)
+        self.project_path = None
+        self.compile_cache = cache.SceneCache()
+        self.journal = journal.Journal()
         self._setup_ui()
         self.disable_all_controls()
 
     @property
     def subtitles(self):
         if self.current_scene not in self.scenes:
-            self.scenes[self.current_scene] = []
+            self.scenes[self.current_scene] = SubtitleTrack()
         return self.scenes[self.current_scene]
 
+    def row_subtitle(self, iid):
+        # Tree rows are keyed by the subtitle's stable id, not by its position
+        try:
+            return self.subtitles.by_id(int(iid))
+        except ValueError:
+            return None
+
+    def row_iid(self, idx):
+        return str(self.subtitles[idx].id)
+
     def disable_all_controls(self):
         self.scene_combo.config(state=tk.DISABLED)
         self.scene_name_entry.config(state=tk.DISABLED)
@@ -87,41 +100,35 @@ class njSubs_Editor:
         self.char_count_label.config(text=f"{byte_count} bytes")
 
     def save_text_entry(self):
+        self.flush_pending_edit()
         sel = self.tree.selection()
         if not sel:
             messagebox.showwarning("Warning", "Select an entry to save")
             return
-        try:
-            idx = int(sel[0])
-            if idx >= len(self.subtitles):
-                return
-        except (ValueError, IndexError):
+        sub = self.row_subtitle(sel[0])
+        if sub is None:
             return
 
         text = self.text_edit_widget.get("1.0", tk.END).rstrip('\n')
 
-        # Validate each line doesn't exceed 36 bytes
-        lines = text.split('\n')
-        exceeded_lines = []
-        for i, line in enumerate(lines, 1):
-            if len(line.encode('utf-8')) > 36:
-                exceeded_lines.append(f"Line {i}: {len(line.encode('utf-8'))} bytes")
-
-        if exceeded_lines:
-            msg = "The following lines exceed 36 bytes:\n" + "\n".join(exceeded_lines)
-            messagebox.showerror("Error", msg)
+        # Lines must fit the game's line width
+        text = self.fit_text(text)
+        if text is None:
             return
+        lines = text.split('\n')
+        old_text, old_x = sub['text'], sub['x']
 
         # Save the text
-        self.subtitles[idx]['text'] = text
+        sub['text'] = text
 
         # Update x position based on auto-center setting
-        if self.subtitles[idx].get('auto_center', True):
+        if sub.get('auto_center', True):
             first_line = lines[0] if lines else ""
-            self.subtitles[idx]['x'] = self.calculate_centered_x(first_line)
+            sub['x'] = self.calculate_centered_x(first_line)
+        self.journal.record_fields(self.current_scene, sub, {'text': (old_text, text), 'x': (old_x, sub['x'])})
 
         self.refresh_tree()
-        self.tree.selection_set(str(idx))
+        self.tree.selection_set(sel[0])
 
     def _setup_ui(self):
         cf = ttk.Frame(self.root)
@@ -173,6 +180,7 @@ class njSubs_Editor:
             else:
                 self.tree.column(col, width=width, anchor=tk.CENTER)
         self.tree.grid(row=0, column=0, sticky='nsew')
+        self.tree_rows = []
         style = ttk.Style()
         style.layout('Vertical.TScrollbar', [('Vertical.Scrollbar.trough',
                                               {'children': [
@@ -192,7 +200,12 @@ class njSubs_Editor:
         self.tree.bind("<Down>", self.on_tree_scroll)
         self.tree.bind("<Prior>", self.on_tree_scroll)
         self.tree.bind("<Next>", self.on_tree_scroll)
-        self.color_canvases = {}
+        self.color_canvases = []
+        self.swatch_job = None
+        self.edit_job = None
+        self.pending_edit = None
+        for seq, handler in (("<Control-z>", self.undo), ("<Control-y>", self.redo), ("<Control-Z>", self.redo)):
+            self.root.bind(seq, handler)
         lb = ttk.Frame(self.root)
         lb.pack(fill=tk.X, padx=20, pady=(0, 5))
         self.add_sub_btn = ttk.Button(lb, text="Add Sub", command=self.add_entry)
@@ -376,13 +389,14 @@ class njSubs_Editor:
         self.scene_names[self.current_scene] = self.scene_name_var.get()
 
     def on_scene_selected(self, e=None):
+        self.flush_pending_edit()
         self.current_scene = int(self.scene_var.get()) - 1
         self.scene_name_var.set(self.scene_names.get(self.current_scene, ""))
         self.clear_edit_fields()
         self.refresh_tree()
         # Auto-select first entry if available
         if self.subtitles:
-            self.tree.selection_set("0")
+            self.tree.selection_set(self.row_iid(0))
             self.on_select()
 
     def new_scene(self):
@@ -390,8 +404,9 @@ class njSubs_Editor:
             new_num = max(self.scenes.keys()) + 1
         else:
             new_num = 0
-        self.scenes[new_num] = []
+        self.scenes[new_num] = SubtitleTrack()
         self.scene_names[new_num] = "None"
+        self.journal.record_scene(new_num, None, (self.scenes[new_num], "None"))
         self.update_scene_combo()
         self.current_scene = new_num
         self.scene_var.set(str(new_num + 1))
@@ -405,6 +420,7 @@ class njSubs_Editor:
             return
         if messagebox.askyesno("Confirm", f"Delete scene {self.current_scene}?"):
             deleted_scene = self.current_scene
+            self.journal.record_scene(deleted_scene, (self.subtitles, self.scene_names.get(deleted_scene, "None")), None)
             del self.scenes[self.current_scene]
             del self.scene_names[self.current_scene]
             self.update_scene_combo()
@@ -432,73 +448,97 @@ class njSubs_Editor:
 
                 # Auto-select first entry of the selected scene if available
                 if self.subtitles:
-                    self.tree.selection_set("0")
+                    self.tree.selection_set(self.row_iid(0))
                     self.on_select()
 
+    def tree_row(self, i, sub):
+        bs = len(sub['text'].encode('utf-8'))
+        auto_center = sub.get('auto_center', True)
+        x = "-" if auto_center else sub.get('x', 0)
+        y = sub.get('y', 0)
+        opacity = sub.get('opacity', 255)
+        text_display = sub['text']
+        if '\n' in text_display:
+            first_line = text_display.split('\n')[0]
+            text_display = first_line + " [...]"
+        values = (self.ms_to_timecode_display(sub['start']),
+                  self.ms_to_timecode_display(sub['end']),
+                  text_display[:40], f"{bs}", x, y, "", opacity)
+        return str(sub.id), str(i + 1), values
+
     def refresh_tree(self):
-        existing_items = list(self.tree.get_children())
-        for item in existing_items:
-            self.tree.delete(item)
-
-        for i, sub in enumerate(self.subtitles):
-            bs = len(sub['text'].encode('utf-8'))
-            auto_center = sub.get('auto_center', True)
-            x = "-" if auto_center else sub.get('x', 0)
-            y = sub.get('y', 0)
-            color = sub.get('color', 'ffbfbfbf')
-            opacity = sub.get('opacity', 255)
-            text_display = sub['text']
-            if '\n' in text_display:
-                first_line = text_display.split('\n')[0]
-                text_display = first_line + " [...]"
-            values = (self.ms_to_timecode_display(sub['start']),
-                      self.ms_to_timecode_display(sub['end']),
-                      text_display[:40], f"{bs}", x, y, "", opacity)
-            self.tree.insert("", tk.END, iid=str(i), text=str(i + 1), values=values)
-
-        self.root.after(10, self.create_color_squares)
+        # Diff against the rows on screen and only touch the ones that changed.
+        # Rows keep their iid when reordered, so a moved subtitle stays selected.
+        rows = [self.tree_row(i, sub) for i, sub in enumerate(self.subtitles)]
+        shown = {row[0]: row for row in self.tree_rows}
+        live = {row[0] for row in rows}
+        gone = [iid for iid in shown if iid not in live]
+        if gone:
+            self.tree.delete(*gone)
+        # Rows still on screen below the ones already placed, in their old order
+        remaining = [row[0] for row in self.tree_rows if row[0] in live]
+        placed = set()
+        j = 0
+        for i, row in enumerate(rows):
+            iid = row[0]
+            while j < len(remaining) and remaining[j] in placed:
+                j += 1
+            old = shown.get(iid)
+            if old is None:
+                self.tree.insert("", i, iid=iid, text=row[1], values=row[2])
+                continue
+            if old != row:
+                self.tree.item(iid, text=row[1], values=row[2])
+            if j < len(remaining) and remaining[j] == iid:
+                j += 1
+            else:
+                self.tree.move(iid, "", i)
+            placed.add(iid)
+        self.tree_rows = rows
 
-    def create_color_squares(self):
-        visible_items = set(self.tree.get_children())
+        self.schedule_color_squares()
 
-        for i in range(len(self.subtitles)):
-            if str(i) not in visible_items:
-                if str(i) in self.color_canvases:
-                    self.color_canvases[str(i)].destroy()
-                    del self.color_canvases[str(i)]
-                continue
+    def schedule_color_squares(self, delay=10):
+        if self.swatch_job is None:
+            self.swatch_job = self.root.after(delay, self.create_color_squares)
 
+    def create_color_squares(self):
+        # A small pool of canvases is reused for the rows in view, so the cost
+        # depends on the viewport height and not on the scene length.
+        self.swatch_job = None
+        count = len(self.subtitles)
+        top = int(self.tree.yview()[0] * count + 0.5) if count else 0
+        used = 0
+        for i in range(top, min(count, top + int(self.tree.cget('height')) + 1)):
             sub = self.subtitles[i]
-            color = sub.get('color', 'ffbfbfbf')
-            bbox = self.tree.bbox(str(i), "Color")
-            if bbox:
-                x, y, w, h = bbox
-                size = min(h - 4, 20)
-                pos_x = x + (w - size) // 2
-                pos_y = y + (h - size) // 2
-
-                if str(i) not in self.color_canvases:
-                    canvas = tk.Canvas(self.tree, width=size, height=size, bg=self._hex_to_display(color),
-                                       relief=tk.SUNKEN, bd=0, cursor="hand2", highlightthickness=0)
-                    self.color_canvases[str(i)] = canvas
-                    canvas.bind("<Button-1>", lambda e, idx=i: self.on_color_click(idx))
-                    canvas.place(x=pos_x, y=pos_y, width=size, height=size)
-                else:
-                    canvas = self.color_canvases[str(i)]
-                    canvas.config(bg=self._hex_to_display(color), width=size, height=size)
-                    canvas.place(x=pos_x, y=pos_y, width=size, height=size)
-
-        for canvas_id in list(self.color_canvases.keys()):
-            if int(canvas_id) >= len(self.subtitles):
-                self.color_canvases[canvas_id].destroy()
-                del self.color_canvases[canvas_id]
+            bbox = self.tree.bbox(str(sub.id), "Color")
+            if not bbox:
+                continue
+            x, y, w, h = bbox
+            size = min(h - 4, 20)
+            if used == len(self.color_canvases):
+                canvas = tk.Canvas(self.tree, relief=tk.SUNKEN, bd=0, cursor="hand2", highlightthickness=0)
+                canvas.bind("<Button-1>", lambda e, c=canvas: self.on_color_click(c.row))
+                canvas.color = None
+                self.color_canvases.append(canvas)
+            canvas = self.color_canvases[used]
+            used += 1
+            canvas.row = str(sub.id)
+            color = self._hex_to_display(sub.get('color', 'ffbfbfbf'))
+            if canvas.color != color:
+                canvas.config(bg=color)
+                canvas.color = color
+            canvas.place(x=x + (w - size) // 2, y=y + (h - size) // 2, width=size, height=size)
+
+        for canvas in self.color_canvases[used:]:
+            canvas.place_forget()
 
     def on_scroll(self, *args):
         self.tree.yview(*args)
-        self.root.after(5, self.create_color_squares)
+        self.schedule_color_squares(5)
 
     def on_tree_scroll(self, e=None):
-        self.root.after(5, self.create_color_squares)
+        self.schedule_color_squares(5)
 
     def on_tree_right_click(self, e):
         item = self.tree.identify('item', e.x, e.y)
@@ -506,6 +546,11 @@ class njSubs_Editor:
             self.tree.selection_set(item)
 
         menu = tk.Menu(self.root, tearoff=False)
+        menu.add_command(label="Undo", accelerator="Ctrl+Z", command=self.undo,
+                         state=tk.NORMAL if self.journal.can_undo() else tk.DISABLED)
+        menu.add_command(label="Redo", accelerator="Ctrl+Y", command=self.redo,
+                         state=tk.NORMAL if self.journal.can_redo() else tk.DISABLED)
+        menu.add_separator()
 
         copy_menu = tk.Menu(menu, tearoff=False)
         copy_menu.add_command(label="Text", command=lambda: self.copy_property('text'))
@@ -524,7 +569,11 @@ class njSubs_Editor:
         menu.add_cascade(label="Paste", menu=paste_menu)
 
         menu.add_separator()
-        menu.add_command(label="Import .srt", command=self.import_srt)
+        menu.add_command(label="Import .srt / .vtt / .ass", command=self.import_srt)
+        menu.add_command(label="Import folder into scenes...", command=self.bulk_import)
+        menu.add_separator()
+        menu.add_command(label="Wrap scene to line width", command=self.wrap_scene)
+        menu.add_command(label="Wrap all scenes to line width", command=lambda: self.wrap_scene(all_scenes=True))
 
         menu.post(e.x_root, e.y_root)
 
@@ -532,10 +581,9 @@ class njSubs_Editor:
         sel = self.tree.selection()
         if not sel:
             return
-        idx = int(sel[0])
-        if idx >= len(self.subtitles):
+        sub = self.row_subtitle(sel[0])
+        if sub is None:
             return
-        sub = self.subtitles[idx]
         if self.clipboard_data is None:
             self.clipboard_data = {}
         if prop == 'text':
@@ -550,6 +598,7 @@ class njSubs_Editor:
             self.clipboard_data['opacity'] = sub.get('opacity', 255)
 
     def paste_property(self, prop):
+        self.flush_pending_edit()
         if self.clipboard_data is None or prop not in self.clipboard_data:
             return
         sel = self.tree.selection()
@@ -557,25 +606,25 @@ class njSubs_Editor:
             return
 
         selected_items = list(sel)
+        self.journal.begin_group()
         for item in selected_items:
-            try:
-                idx = int(item)
-                if idx >= len(self.subtitles):
-                    continue
-                sub = self.subtitles[idx]
-                if prop == 'text':
-                    sub['text'] = self.clipboard_data['text']
-                elif prop == 'color':
-                    sub['color'] = self.clipboard_data['color']
-                elif prop == 'x':
-                    sub['x'] = self.clipboard_data['x']
-                    sub['auto_center'] = False
-                elif prop == 'y':
-                    sub['y'] = self.clipboard_data['y']
-                elif prop == 'opacity':
-                    sub['opacity'] = self.clipboard_data['opacity']
-            except (ValueError, IndexError):
+            sub = self.row_subtitle(item)
+            if sub is None:
                 continue
+            before = {k: sub[k] for k in ('text', 'color', 'x', 'y', 'opacity', 'auto_center')}
+            if prop == 'text':
+                sub['text'] = self.clipboard_data['text']
+            elif prop == 'color':
+                sub['color'] = self.clipboard_data['color']
+            elif prop == 'x':
+                sub['x'] = self.clipboard_data['x']
+                sub['auto_center'] = False
+            elif prop == 'y':
+                sub['y'] = self.clipboard_data['y']
+            elif prop == 'opacity':
+                sub['opacity'] = self.clipboard_data['opacity']
+            self.journal.record_fields(self.current_scene, sub, {k: (v, sub[k]) for k, v in before.items()})
+        self.journal.end_group()
 
         self.refresh_tree()
         # Reselect the previously selected items
@@ -583,7 +632,9 @@ class njSubs_Editor:
             self.tree.selection_add(item)
 
     def import_srt(self):
-        fp = filedialog.askopenfilename(filetypes=[("SRT files", "*.srt"), ("All files", "*.*")])
+        self.flush_pending_edit()
+        fp = filedialog.askopenfilename(filetypes=[("Subtitle files", "*.srt *.vtt *.ass *.ssa"),
+                                                   ("All files", "*.*")])
         if not fp:
             return
 
@@ -591,86 +642,106 @@ class njSubs_Editor:
             return
 
         try:
-            srt_subs = self.parse_srt(fp)
-            if not srt_subs:
-                messagebox.showwarning("Warning", "No subtitles found in SRT file")
+            diagnostics = []
+            subs = [Subtitle(cue.start, cue.end, cue.text, x=2, y=25)
+                    for cue in subfile.read_cues(fp, diagnostics=diagnostics)]
+            if not subs:
+                messagebox.showwarning("Warning", "No subtitles found in file" + self.diagnostics_text(diagnostics))
                 return
 
-            self.subtitles.clear()
-            for srt_sub in srt_subs:
-                text = srt_sub['text'][:]
-                sub = {
-                    'start': srt_sub['start'],
-                    'end': srt_sub['end'],
-                    'text': text,
-                    'x': 2,
-                    'y': 25,
-                    'color': 'ffbfbfbf',
-                    'opacity': 255,
-                    'auto_center': True
-                }
-                self.subtitles.append(sub)
-
-            self.subtitles.sort(key=lambda x: x['start'])
+            old = (self.subtitles, self.scene_names.get(self.current_scene, "None"))
+            self.scenes[self.current_scene] = SubtitleTrack(subs)
+            self.journal.record_scene(self.current_scene, old, (self.subtitles, old[1]))
             self.refresh_tree()
             # Auto-select first entry after import
             if self.subtitles:
-                self.tree.selection_set("0")
+                self.tree.selection_set(self.row_iid(0))
                 self.on_select()
-            messagebox.showinfo("Success", f"Imported {len(srt_subs)} subtitles from SRT file")
+            messagebox.showinfo("Success", f"Imported {len(subs)} subtitles from {Path(fp).name}"
+                                + self.diagnostics_text(diagnostics))
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to import SRT file: {e}")
+            messagebox.showerror("Error", f"Failed to import subtitle file: {e}")
 
-    def parse_srt(self, filepath):
-        srt_subs = []
+    def bulk_import(self):
+        self.flush_pending_edit()
+        directory = filedialog.askdirectory(title="Folder of subtitle files")
+        if not directory:
+            return
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            blocks = content.split('\n\n')
-
-            for block in blocks:
-                lines = block.strip().split('\n')
-                if len(lines) < 3:
-                    continue
-
-                timecode_line = lines[1]
-                timecode_match = re.match(
-                    r'(\d{2}):(\d{2}):(\d{2}),(\d{3})\s*-->\s*(\d{2}):(\d{2}):(\d{2}),(\d{3})',
-                    timecode_line)
-                if not timecode_match:
-                    continue
-
-                h1, m1, s1, ms1, h2, m2, s2, ms2 = map(int, timecode_match.groups())
-                start = self.components_to_ms(h1, m1, s1, ms1)
-                end = self.components_to_ms(h2, m2, s2, ms2)
-
-                text = '\n'.join(lines[2:]).strip()
-
-                srt_subs.append({
-                    'start': start,
-                    'end': end,
-                    'text': text
-                })
+            rules = None
+            mapping = os.path.join(directory, subfile.MAPPING_FILE)
+            if os.path.exists(mapping):
+                rules = subfile.load_mapping(mapping)
+            files, skipped = subfile.map_files(directory, rules)
+        except (OSError, ValueError, KeyError, re.error) as e:
+            messagebox.showerror("Error", f"Failed to read folder: {e}")
+            return
+        if not files:
+            messagebox.showwarning("Warning", "No subtitle files in this folder match a scene")
+            return
+        replaced = sorted(k for k in {f.scene for f in files}
+                          if k in self.scenes and project.scene_length(self.scenes, k))
+        if replaced and not messagebox.askyesno(
+                "Confirm", f"Overwrite {len(replaced)} scenes that already have subtitles "
+                           f"({', '.join(str(k + 1) for k in replaced[:10])}{', ...' if len(replaced) > 10 else ''})?"):
+            return
 
-            return srt_subs
-        except Exception as e:
-            print(f"SRT Parse error: {e}")
-            return []
+        imported = 0
+        scenes = []
+        lines = []
+        self.journal.begin_group()
+        for result in subfile.bulk_read(files):
+            name = os.path.basename(result.path)
+            if result.error or not result.cues:
+                skipped.append((result.path, result.error or "no subtitles found"))
+                continue
+            old = ((self.scenes[result.scene], self.scene_names.get(result.scene, "None"))
+                   if result.scene in self.scenes else None)
+            self.scenes[result.scene] = SubtitleTrack(
+                Subtitle(cue.start, cue.end, cue.text, x=2, y=25) for cue in result.cues)
+            self.scene_names[result.scene] = result.name
+            self.journal.record_scene(result.scene, old, (self.scenes[result.scene], result.name))
+            imported += len(result.cues)
+            scenes.append(result.scene)
+            if result.diagnostics:
+                lines.append(f"{name} -> scene {result.scene + 1}: {len(result.diagnostics)} warnings, "
+                             f"first at line {result.diagnostics[0].line}: {result.diagnostics[0].message}")
+        self.journal.end_group()
+        for path, reason in skipped:
+            lines.append(f"{os.path.basename(path)}: skipped, {reason}")
+
+        if scenes:
+            self.current_scene = min(scenes)
+            self.update_scene_combo()
+            self.clear_edit_fields()
+            self.refresh_tree()
+            if self.subtitles:
+                self.tree.selection_set(self.row_iid(0))
+                self.on_select()
+        msg = f"Imported {imported} subtitles into {len(scenes)} scenes."
+        if lines:
+            msg += "\n\n" + "\n".join(lines[:20])
+            if len(lines) > 20:
+                msg += f"\n... and {len(lines) - 20} more"
+        messagebox.showinfo("Bulk Import", msg)
+
+    def diagnostics_text(self, diagnostics, limit=10):
+        if not diagnostics:
+            return ""
+        lines = [f"Line {d.line}: {d.message}" for d in diagnostics[:limit]]
+        if len(diagnostics) > limit:
+            lines.append(f"... and {len(diagnostics) - limit} more")
+        return f"\n\n{len(diagnostics)} warnings:\n" + "\n".join(lines)
 
     def on_select(self, e=None):
+        # The fields still hold the previous row: apply its pending edit first
+        self.flush_pending_edit()
         sel = self.tree.selection()
         if not sel:
             self.clear_edit_fields()
             return
-        try:
-            display_idx = int(sel[0])
-            idx = display_idx
-            if idx >= len(self.subtitles):
-                self.clear_edit_fields()
-                return
-            sub = self.subtitles[idx]
-        except (ValueError, IndexError):
+        sub = self.row_subtitle(sel[0])
+        if sub is None:
             self.clear_edit_fields()
             return
 
@@ -731,9 +802,43 @@ class njSubs_Editor:
         self.x_entry.config(state=tk.DISABLED if self.auto_center_var.get() else tk.NORMAL)
         self.auto_update_list()
 
+    def line_width(self):
+        try:
+            return int(self.asm_settings.get('line_width', runtime.DEFAULT_LINE_WIDTH))
+        except ValueError:
+            return runtime.DEFAULT_LINE_WIDTH
+
     def calculate_centered_x(self, text):
-        text_len = len(text.encode('utf-8'))
-        return ((36 - text_len) // 2) + 2
+        return wrap.centered_x(text, self.line_width())
+
+    def fit_text(self, text):
+        """text if every line fits the line width, else its wrapped form if the user agrees, else None."""
+        width = self.line_width()
+        exceeded = wrap.overlong_lines(text, width)
+        if not exceeded:
+            return text
+        msg = (f"The following lines exceed {width} bytes:\n"
+               + "\n".join(f"Line {i}: {size} bytes" for i, size in exceeded) + "\n\nWrap the text to fit?")
+        if messagebox.askyesno("Line Width", msg):
+            return wrap.wrap_text(text, width)
+        return None
+
+    def wrap_scene(self, all_scenes=False):
+        self.flush_pending_edit()
+        width = self.line_width()
+        scenes = sorted(self.scenes) if all_scenes else [self.current_scene]
+        before = {k: [(sub, sub['text'], sub['x']) for sub in self.scenes[k]] for k in scenes}
+        changed = sum(wrap.wrap_subtitles(self.scenes[k], width) for k in scenes)
+        self.journal.begin_group()
+        for k, rows in before.items():
+            for sub, text, x in rows:
+                self.journal.record_fields(k, sub, {'text': (text, sub['text']), 'x': (x, sub['x'])})
+        self.journal.end_group()
+        sel = self.tree.selection()
+        self.refresh_tree()
+        if sel:
+            self.on_select()
+        messagebox.showinfo("Wrap", f"Re-wrapped {changed} subtitles to {width} bytes per line")
 
     def clear_edit_fields(self):
         self.updating_fields = True
@@ -765,12 +870,25 @@ class njSubs_Editor:
         sel = self.tree.selection()
         if not sel:
             return
-        try:
-            idx = int(sel[0])
-        except (IndexError, ValueError):
+        sub = self.row_subtitle(sel[0])
+        if sub is None:
             return
 
-        if idx >= len(self.subtitles):
+        # Coalesce bursts (typing, wheel scrolling) into one update per frame
+        self.pending_edit = sub
+        if self.edit_job is None:
+            self.edit_job = self.root.after(EDIT_COALESCE_MS, self.apply_pending_edit)
+
+    def flush_pending_edit(self):
+        if self.edit_job is not None:
+            self.root.after_cancel(self.edit_job)
+            self.apply_pending_edit()
+
+    def apply_pending_edit(self):
+        self.edit_job = None
+        sub_ref = self.pending_edit
+        self.pending_edit = None
+        if sub_ref not in self.subtitles:
             return
 
         try:
@@ -785,7 +903,7 @@ class njSubs_Editor:
             start = self.components_to_ms(sh, sm, ss, sms)
             end = self.components_to_ms(eh, em, es, ems)
             auto_center = self.auto_center_var.get()
-            text = self.subtitles[idx]['text']
+            text = sub_ref['text']
             if auto_center:
                 x = self.calculate_centered_x(text)
             else:
@@ -801,14 +919,15 @@ class njSubs_Editor:
             color = self.rgb_to_argb(r, g, b, opacity)
 
             if start < end:
-                sub_ref = self.subtitles[idx]
-                sub_ref.update(
-                    {'start': start, 'end': end, 'x': x, 'y': y, 'color': color, 'opacity': opacity,
-                     'auto_center': auto_center})
-                self.subtitles.sort(key=lambda x: x['start'])
-                new_idx = self.subtitles.index(sub_ref)
+                changes = {'start': start, 'end': end, 'x': x, 'y': y, 'color': color, 'opacity': opacity,
+                           'auto_center': auto_center}
+                # Wheel scrolling a field merges into one undo step
+                self.journal.record_fields(self.current_scene, sub_ref,
+                                           {k: (sub_ref[k], v) for k, v in changes.items()})
+                del changes['start']
+                sub_ref.update(changes)
+                self.subtitles.move(sub_ref, start)
                 self.refresh_tree()
-                self.tree.selection_set(str(new_idx))
         except (ValueError, IndexError):
             pass
 
@@ -829,32 +948,34 @@ class njSubs_Editor:
         self.auto_update_list()
         return "break"
 
-    def on_color_click(self, idx):
-        if idx < len(self.subtitles):
-            self.tree.selection_set(str(idx))
+    def on_color_click(self, iid):
+        sub = self.row_subtitle(iid)
+        if sub is not None:
+            self.tree.selection_set(iid)
             self.on_select()
-            rgb, _ = colorchooser.askcolor(self.argb_to_rgb(self.subtitles[idx]['color']),
-                                           title="Pick Subtitle Color")
+            rgb, _ = colorchooser.askcolor(self.argb_to_rgb(sub['color']), title="Pick Subtitle Color")
             if rgb:
                 r, g, b = [int(c) for c in rgb]
-                opacity = self.subtitles[idx].get('opacity', 255)
-                self.subtitles[idx]['color'] = self.rgb_to_argb(r, g, b, opacity)
-                self.color_var.set(self.subtitles[idx]['color'])
-                self.color_canvas.config(bg=self._hex_to_display(self.subtitles[idx]['color']))
-                if str(idx) in self.color_canvases:
-                    self.color_canvases[str(idx)].config(bg=self._hex_to_display(self.subtitles[idx]['color']))
+                opacity = sub.get('opacity', 255)
+                color = self.rgb_to_argb(r, g, b, opacity)
+                self.journal.record_fields(self.current_scene, sub, {'color': (sub['color'], color)})
+                sub['color'] = color
+                self.color_var.set(sub['color'])
+                self.color_canvas.config(bg=self._hex_to_display(sub['color']))
                 self.refresh_tree()
-                self.tree.selection_set(str(idx))
+                self.tree.selection_set(iid)
 
     def on_text_edit(self, e):
         sel = self.tree.selection()
         if not sel or self.tree.identify_column(e.x) != "#3":
             return
-        idx = int(sel[0])
+        sub = self.row_subtitle(sel[0])
+        if sub is None:
+            return
         self.cancel_text_edit()
 
         self.edit_entry = tk.Text(self.root, font=("Arial", 10), height=4, wrap=tk.WORD)
-        self.edit_entry.insert("1.0", self.subtitles[idx]['text'])
+        self.edit_entry.insert("1.0", sub['text'])
 
         bbox = self.tree.bbox(sel[0], "#3")
         if bbox:
@@ -865,7 +986,7 @@ class njSubs_Editor:
             self.edit_entry.place(x=root_x, y=root_y, width=bbox[2], height=100)
             self.edit_entry.focus()
             self.edit_entry.tag_add(tk.SEL, "1.0", tk.END)
-            self.edit_idx = idx
+            self.edit_sub = sub
 
             self.edit_entry.bind("<Control-Return>", self.save_text_edit)
             self.edit_entry.bind("<FocusOut>", self.save_text_edit)
@@ -875,24 +996,20 @@ class njSubs_Editor:
         if not hasattr(self, 'edit_entry'):
             return
 
-        text = self.edit_entry.get("1.0", tk.END).rstrip('\n')
-        lines = text.split('\n')
-
-        exceeded_lines = []
-        for i, line in enumerate(lines, 1):
-            if len(line.encode('utf-8')) > 36:
-                exceeded_lines.append(f"Line {i}: {len(line.encode('utf-8'))} bytes")
-
-        if exceeded_lines:
-            msg = "The following lines exceed 36 bytes:\n" + "\n".join(exceeded_lines)
-            messagebox.showerror("Error", msg)
+        text = self.fit_text(self.edit_entry.get("1.0", tk.END).rstrip('\n'))
+        if text is None:
             return
+        lines = text.split('\n')
+        old_text, old_x = self.edit_sub['text'], self.edit_sub['x']
 
-        self.subtitles[self.edit_idx]['text'] = text
+        self.edit_sub['text'] = text
 
-        if self.subtitles[self.edit_idx].get('auto_center', True):
+        if self.edit_sub.get('auto_center', True):
             first_line = lines[0] if lines else ""
-            self.subtitles[self.edit_idx]['x'] = self.calculate_centered_x(first_line)
+            self.edit_sub['x'] = self.calculate_centered_x(first_line)
+        if self.edit_sub in self.subtitles:
+            self.journal.record_fields(self.current_scene, self.edit_sub,
+                                       {'text': (old_text, text), 'x': (old_x, self.edit_sub['x'])})
 
         self.refresh_tree()
         self.edit_entry.place_forget()
@@ -901,7 +1018,37 @@ class njSubs_Editor:
         if hasattr(self, 'edit_entry'):
             self.edit_entry.place_forget()
 
+    def undo(self, e=None):
+        self.show_journal_step(self.journal.undo)
+        return "break"
+
+    def redo(self, e=None):
+        self.show_journal_step(self.journal.redo)
+        return "break"
+
+    def show_journal_step(self, step):
+        if not self.project_loaded:
+            return
+        self.flush_pending_edit()
+        self.cancel_text_edit()
+        focus = step(self.scenes, self.scene_names)
+        if focus is None:
+            return
+        scene, sub = focus
+        self.current_scene = scene if scene in self.scenes else min(self.scenes)
+        self.update_scene_combo()
+        self.clear_edit_fields()
+        self.refresh_tree()
+        if sub is not None and sub in self.subtitles:
+            self.tree.selection_set(str(sub.id))
+            self.tree.see(str(sub.id))
+            self.on_select()
+        elif self.subtitles:
+            self.tree.selection_set(self.row_iid(0))
+            self.on_select()
+
     def add_entry(self):
+        self.flush_pending_edit()
         if self.subtitles:
             s = self.subtitles[-1]['end']
             last_color = self.subtitles[-1].get('color', 'ffbfbfbf')
@@ -909,32 +1056,35 @@ class njSubs_Editor:
             last_auto_center = self.subtitles[-1].get('auto_center', True)
             last_x = self.subtitles[-1].get('x', 0)
             last_y = self.subtitles[-1].get('y', 0)
-            self.subtitles.append({'start': s, 'end': s + 1000, 'text': '', 'x': last_x, 'y': last_y,
-                                   'color': last_color, 'opacity': last_opacity, 'auto_center': last_auto_center})
+            sub = Subtitle(s, s + 1000, '', x=last_x, y=last_y, color=last_color, opacity=last_opacity,
+                           auto_center=last_auto_center)
         else:
-            self.subtitles.append({'start': 0, 'end': 1000, 'text': '', 'x': 0, 'y': 0,
-                                   'color': 'ffbfbfbf', 'opacity': 255, 'auto_center': True})
+            sub = Subtitle(0, 1000, '')
+        self.subtitles.insert(sub)
+        self.journal.record_insert(self.current_scene, sub)
         self.refresh_tree()
         # Auto-select the newly added entry
-        new_idx = len(self.subtitles) - 1
-        self.tree.selection_set(str(new_idx))
+        self.tree.selection_set(str(sub.id))
         self.on_select()
 
     def delete_entry(self):
+        self.flush_pending_edit()
         sel = self.tree.selection()
         if not sel:
             messagebox.showwarning("Warning", "Select an entry to delete")
             return
-        deleted_idx = int(sel[0])
-        del self.subtitles[deleted_idx]
-        self.subtitles.sort(key=lambda x: x['start'])
+        sub = self.row_subtitle(sel[0])
+        if sub is None:
+            return
+        deleted_idx = self.subtitles.remove(sub)
+        self.journal.record_delete(self.current_scene, sub)
         self.refresh_tree()
         # Auto-select previous entry if available
         if self.subtitles:
             # If deleted the last entry, select the new last entry
             # Otherwise select the entry at the same index (which is now the next one)
             new_idx = min(deleted_idx, len(self.subtitles) - 1)
-            self.tree.selection_set(str(new_idx))
+            self.tree.selection_set(self.row_iid(new_idx))
             self.on_select()
         else:
             self.clear_edit_fields()
@@ -950,7 +1100,7 @@ class njSubs_Editor:
 
         w = tk.Toplevel(self.root)
         w.title("ASM Settings")
-        w.geometry("600x500")
+        w.geometry("660x790")
         icon_path = self.resource_path("ninja.ico")
         w.iconbitmap(icon_path)
         w.resizable(False, False)
@@ -999,6 +1149,10 @@ class njSubs_Editor:
                                                                                                    padx=(5, 0))
         vars_dict['empty_space_offset'] = var_empty_start
         vars_dict['empty_space_end'] = var_empty_end
+        # End of the free run the window was found in, so builds can grow it
+        vars_dict['free_space_end'] = tk.StringVar(value=self.asm_settings.get('free_space_end', '0x00000000'))
+        ttk.Button(empty_space_frame, text="Find", width=5,
+                   command=lambda: self.find_empty_space(vars_dict)).pack(side=tk.LEFT, padx=(5, 0))
 
         ttk.Label(csf, text="Timer Offset:").grid(row=1, column=0, sticky=tk.W, pady=8)
         var_timer = tk.StringVar(value=self.asm_settings.get('timer_offset', '0x8C010000'))
@@ -1010,6 +1164,36 @@ class njSubs_Editor:
         vars_dict['game_fps'] = var_fps
         tk.Entry(csf, textvariable=var_fps, width=5, font=("Arial", 12)).grid(row=2, column=1, sticky=tk.W, pady=8)
 
+        ttk.Label(csf, text="Runtime:").grid(row=3, column=0, sticky=tk.W, pady=8)
+        var_runtime = tk.StringVar(value=self.asm_settings.get('runtime', 'classic'))
+        vars_dict['runtime'] = var_runtime
+        ttk.Combobox(csf, textvariable=var_runtime, values=list(runtime.RUNTIMES), width=10,
+                     state='readonly').grid(row=3, column=1, sticky=tk.W, pady=8)
+
+        ttk.Label(csf, text="Text IDs:").grid(row=4, column=0, sticky=tk.W, pady=8)
+        var_sequence_format = tk.StringVar(value=self.asm_settings.get('sequence_format', 'compact'))
+        vars_dict['sequence_format'] = var_sequence_format
+        ttk.Combobox(csf, textvariable=var_sequence_format, values=list(runtime.SEQUENCE_FORMATS), width=10,
+                     state='readonly').grid(row=4, column=1, sticky=tk.W, pady=8)
+
+        ttk.Label(csf, text="Text Coding:").grid(row=5, column=0, sticky=tk.W, pady=8)
+        var_text_encoding = tk.StringVar(value=self.asm_settings.get('text_encoding', 'plain'))
+        vars_dict['text_encoding'] = var_text_encoding
+        ttk.Combobox(csf, textvariable=var_text_encoding, values=list(runtime.TEXT_ENCODINGS), width=10,
+                     state='readonly').grid(row=5, column=1, sticky=tk.W, pady=8)
+
+        ttk.Label(csf, text="Time Values:").grid(row=6, column=0, sticky=tk.W, pady=8)
+        var_time_format = tk.StringVar(value=self.asm_settings.get('time_format', 'u16'))
+        vars_dict['time_format'] = var_time_format
+        ttk.Combobox(csf, textvariable=var_time_format, values=list(runtime.TIME_FORMATS), width=10,
+                     state='readonly').grid(row=6, column=1, sticky=tk.W, pady=8)
+
+        ttk.Label(csf, text="Line Width:").grid(row=7, column=0, sticky=tk.W, pady=8)
+        var_line_width = tk.StringVar(value=self.asm_settings.get('line_width', '36'))
+        vars_dict['line_width'] = var_line_width
+        tk.Entry(csf, textvariable=var_line_width, width=5, font=("Arial", 12)).grid(row=7, column=1, sticky=tk.W,
+                                                                                     pady=8)
+
         color_backup_container = ttk.Frame(mf)
         color_backup_container.grid(row=2, column=0, columnspan=3, sticky=tk.EW, pady=5)
 
@@ -1044,14 +1228,35 @@ class njSubs_Editor:
         vars_dict['ignore_font_fix'] = var_ignore_font
         ttk.Checkbutton(backup_cf, text="Ignore Font Fix", variable=var_ignore_font).pack(anchor=tk.W, pady=5)
 
+        var_incremental = tk.BooleanVar(value=self.asm_settings.get('incremental_patch', False))
+        vars_dict['incremental_patch'] = var_incremental
+        ttk.Checkbutton(backup_cf, text="Patch in place, differing bytes only\n(undo record, no full backup)",
+                        variable=var_incremental).pack(anchor=tk.W, pady=5)
+
+        var_cache_file = tk.BooleanVar(value=self.asm_settings.get('compile_cache_file', False))
+        vars_dict['compile_cache_file'] = var_cache_file
+        ttk.Checkbutton(backup_cf, text="Keep compile cache\nnext to project", variable=var_cache_file).pack(
+            anchor=tk.W, pady=5)
+
         bf = ttk.Frame(mf)
         bf.grid(row=3, column=0, columnspan=3, pady=20)
 
         def save_settings():
+            try:
+                line_width = int(vars_dict['line_width'].get())
+                if not 1 <= line_width <= runtime.MAX_LINE_WIDTH:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Error", f"Line Width must be 1 to {runtime.MAX_LINE_WIDTH} bytes")
+                return
+            width_changed = line_width != self.line_width()
             self.asm_settings.update({k: vars_dict[k].get() for k in vars_dict if
-                                      k not in ['base_opacity', 'backup_executable', 'ignore_font_fix']})
+                                      k not in ['base_opacity', 'backup_executable', 'ignore_font_fix',
+                                                'incremental_patch', 'compile_cache_file']})
             self.asm_settings['backup_executable'] = vars_dict['backup_executable'].get()
             self.asm_settings['ignore_font_fix'] = vars_dict['ignore_font_fix'].get()
+            self.asm_settings['incremental_patch'] = vars_dict['incremental_patch'].get()
+            self.asm_settings['compile_cache_file'] = vars_dict['compile_cache_file'].get()
             try:
                 opacity = int(vars_dict['base_opacity'].get() or 255)
                 opacity = max(0, min(255, opacity))
@@ -1061,6 +1266,8 @@ class njSubs_Editor:
                 pass
             messagebox.showinfo("Success", "ASM Settings saved")
             w.destroy()
+            if width_changed and messagebox.askyesno("Line Width", f"Re-wrap all scenes to {line_width} bytes?"):
+                self.wrap_scene(all_scenes=True)
 
         ttk.Button(bf, text="Save", command=save_settings).pack(side=tk.LEFT, padx=5, ipady=5)
         ttk.Button(bf, text="Cancel", command=w.destroy).pack(side=tk.LEFT, padx=5, ipady=5)
@@ -1094,44 +1301,47 @@ class njSubs_Editor:
         else:
             messagebox.showinfo("Scan", "No patterns found in executable")
 
+    def find_empty_space(self, vars_dict):
+        settings = dict(self.asm_settings)
+        settings.update({k: v.get() for k, v in vars_dict.items() if k != 'base_opacity'})
+        pd = {'scenes': self.scenes, 'scene_names': self.scene_names, 'asm_settings': settings}
+        try:
+            needed = compiler.layout_project(pd).size
+        except Exception:
+            needed = 256
+        try:
+            candidates = scanner.scan_free_space(settings['game_binary'], needed)
+        except Exception as e:
+            messagebox.showerror("Error", f"Game Binary: {e}")
+            return
+        if not candidates:
+            messagebox.showerror("Error", f"No free space of {needed} bytes found in executable")
+            return
+        best = candidates[0]
+        start, end, run_end = compiler.claim_free_space(best, needed, int(settings['executable_base_offset'], 16))
+        vars_dict['empty_space_offset'].set(f"0x{start:08X}")
+        vars_dict['empty_space_end'].set(f"0x{end:08X}")
+        vars_dict['free_space_end'].set(f"0x{run_end:08X}")
+        messagebox.showinfo("Empty Space", f"Found {best.length} free bytes (0x{best.fill:02X} padding).\n"
+                                           f"Subtitles currently need {needed} bytes; the window leaves room to "
+                                           f"grow and widens into the rest of the run when needed.")
+
     def scan_executable(self, filepath):
         try:
-            with open(filepath, 'rb') as f:
-                data = f.read()
-            nj_patterns = [
-                bytes.fromhex('224f03e51d900c3f422f1b90fc300470 0825'),
-                bytes.fromhex('224f1e900c3f1d9003e5422ffc300470 0825')
-            ]
-            njc_patterns = [bytes.fromhex('04d20b004222'), bytes.fromhex('03d20b004222')]
-            found = {}
-            for pattern in nj_patterns:
-                idx = data.find(pattern)
-                if idx != -1:
-                    found['njprint'] = f"0x{idx + 0x8c010000:08x}"
-                    break
-            for i, pattern in enumerate(njc_patterns):
-                idx = data.find(pattern)
-                if idx != -1:
-                    found['njprint_color'] = f"0x{idx + 0x8c010000:08x}"
-                    color_offset = idx + 14 if i == 0 else idx + 10
-                    if color_offset + 4 <= len(data):
-                        color_val = struct.unpack('<I', data[color_offset:color_offset + 4])[0]
-                        found['base_color_argb'] = f"{color_val:08x}"
-                    break
-            return found
+            return scanner.scan_executable(filepath)
         except Exception as e:
             print(f"Scan error: {e}")
             return {}
 
     def load_project(self, fp=None):
         if not fp:
-            fp = filedialog.askopenfilename(filetypes=[("Project files", "*.prj"), ("All files", "*.*")])
+            fp = filedialog.askopenfilename(filetypes=[("Project files", "*.prj *.prjz"), ("All files", "*.*")])
             if not fp:
                 return
         try:
-            with open(fp, 'r') as f:
-                pd = json.load(f)
-            self.scenes = {int(k): v for k, v in pd.get('scenes', {0: []}).items()}
+            # Scenes are decoded when first shown (see the subtitles property)
+            pd = project.open_project(fp, SubtitleTrack)
+            self.scenes = pd['scenes']
             self.scene_names = {int(k): v for k, v in pd.get('scene_names', {}).items()}
 
             loaded_asm = pd.get('asm_settings', {})
@@ -1147,20 +1357,25 @@ class njSubs_Editor:
                 self.asm_settings['ignore_font_fix'] = False
 
             if not self.scenes:
-                self.scenes = {0: []}
+                self.scenes[0] = SubtitleTrack()
             self.current_scene = 0
+            self.project_path = fp
+            self.compile_cache = cache.SceneCache()
+            self.journal.clear()
             self.update_scene_combo()
             self.refresh_tree()
             # Auto-select first entry if available
             if self.subtitles:
-                self.tree.selection_set("0")
+                self.tree.selection_set(self.row_iid(0))
                 self.on_select()
             self.enable_all_controls()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load project: {e}")
 
     def save_project(self):
-        fp = filedialog.asksaveasfilename(filetypes=[("Project files", "*.prj")])
+        self.flush_pending_edit()
+        fp = filedialog.asksaveasfilename(filetypes=[("Project files", "*.prj"),
+                                                     ("Compressed project files", "*.prjz")])
         if fp:
             try:
                 # Ensure backup_executable is properly saved
@@ -1170,8 +1385,8 @@ class njSubs_Editor:
                     asm_to_save['backup_executable'] = asm_to_save['backup_executable']
 
                 pd = {'scenes': self.scenes, 'scene_names': self.scene_names, 'asm_settings': asm_to_save}
-                with open(fp, 'w') as f:
-                    json.dump(pd, f, indent=2)
+                project.save_project(pd, fp)
+                self.project_path = fp
                 messagebox.showinfo("Success", "Project saved")
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to save project: {e}")
@@ -1181,15 +1396,13 @@ class njSubs_Editor:
         if not fp:
             return
         if messagebox.askyesno("Confirm", "Start a new project with this executable?"):
-            self.scenes = {0: []}
+            self.scenes = {0: SubtitleTrack()}
             self.scene_names = {0: "None"}
             self.current_scene = 0
-            self.asm_settings = {'game_binary': fp, 'executable_base_offset': '0x8c010000',
-                                 'empty_space_offset': '0x8C010000', 'empty_space_end': '0x00',
-                                 'njprint_offset': '0x00000000',
-                                 'njprint_color_offset': '0x00000000', 'timer_offset': '0x00000000',
-                                 'base_color_argb': 'ffbfbfbf', 'game_fps': '60', 'backup_executable': True,
-                                 'ignore_font_fix': False}
+            self.asm_settings = dict(project.DEFAULT_ASM_SETTINGS, game_binary=fp)
+            self.project_path = None
+            self.compile_cache = cache.SceneCache()
+            self.journal.clear()
             found = self.scan_executable(fp)
             if found:
                 msg = "Scan Results:\n"
@@ -1208,7 +1421,7 @@ class njSubs_Editor:
             self.clear_edit_fields()
             # Auto-select first entry if available
             if self.subtitles:
-                self.tree.selection_set("0")
+                self.tree.selection_set(self.row_iid(0))
                 self.on_select()
             else:
                 # Ensure all entry widgets are disabled when starting new project with no entries
@@ -1216,348 +1429,65 @@ class njSubs_Editor:
             self.enable_all_controls()
 
     def load_file(self):
-        fp = filedialog.askopenfilename(filetypes=[("Project files", "*.prj"), ("All files", "*.*")])
+        fp = filedialog.askopenfilename(filetypes=[("Project files", "*.prj *.prjz"), ("All files", "*.*")])
         if not fp:
             return
         fp = Path(fp)
-        if fp.suffix.lower() == '.prj':
+        if fp.suffix.lower() in ('.prj', project.COMPACT_EXTENSION):
             self.load_project(str(fp))
         else:
-            messagebox.showerror("Error", "Unsupported file type. Use .prj")
-
-    def apply_apostrophe_fix(self, executable):
-        if self.asm_settings.get('ignore_font_fix', False):
-            return executable
-
-        pattern_v1 = bytes.fromhex('16 29 28 07 00 00 15 02 00 00 00 00 22 01 00 00 15 02 04 01')
-        replacement_v1 = bytes.fromhex('16 29 28 07 00 00 15 02 00 00 00 00 22 01 00 00 00 00 00 00')
-
-        pattern_v2 = bytes.fromhex(
-            'FF FF CE B9 CE B9 CE B9 CE B9 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 FF FF 00 00 00 00 CE B9 00 00 00 00 CE B9 00 00 00 00 CE B9')
-        replacement_v2 = bytes.fromhex(
-            'FF FF CE B9 CE B9 CE B9 CE B9 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00')
-
-        idx_v1 = executable.find(pattern_v1)
-        if idx_v1 != -1:
-            msg = "Apostrophe Font V1 found in executable.\n\nApply Fix?"
-            if messagebox.askyesno("Apostrophe Fix", msg):
-                executable[idx_v1:idx_v1 + len(replacement_v1)] = replacement_v1
-                messagebox.showinfo("Success", "V1 Fix applied successfully!")
-                return executable
-
-        idx_v2 = executable.find(pattern_v2)
-        if idx_v2 != -1:
-            msg = "Apostrophe Font V2 found in executable.\n\nApply Fix?"
-            if messagebox.askyesno("Apostrophe Fix", msg):
-                executable[idx_v2:idx_v2 + len(replacement_v2)] = replacement_v2
-                messagebox.showinfo("Success", "V2 Fix applied successfully!")
-                return executable
-
-        return executable
+            messagebox.showerror("Error", "Unsupported file type. Use .prj or .prjz")
+
+    def current_project(self):
+        return {'scenes': self.scenes, 'scene_names': self.scene_names, 'asm_settings': self.asm_settings}
+
+    def current_cache(self):
+        path = None
+        if self.project_path and self.asm_settings.get('compile_cache_file', False):
+            path = cache.cache_path(self.project_path)
+        if self.compile_cache.path != path:
+            self.compile_cache = cache.SceneCache(path)
+        return self.compile_cache
+
+    def confirm_font_fix(self, variant):
+        msg = f"Apostrophe Font {variant} found in executable.\n\nApply Fix?"
+        if messagebox.askyesno("Apostrophe Fix", msg):
+            messagebox.showinfo("Success", f"{variant} Fix applied successfully!")
+            return True
+        return False
 
     def save_output(self):
-        has_any_subs = any(len(subs) > 0 for subs in self.scenes.values())
+        self.flush_pending_edit()
+        has_any_subs = any(project.scene_length(self.scenes, k) for k in self.scenes)
         if not has_any_subs:
             messagebox.showwarning("Warning", "No subtitles to save")
             return
 
-        # Show progress message
-        progress_window = tk.Toplevel(self.root)
-        progress_window.withdraw()
-
+        stats = {}
+        window = (self.asm_settings.get('empty_space_offset'), self.asm_settings.get('empty_space_end'))
         try:
-            buffer = bytearray([
-                0x22,0x4F,0x08,0x42,0x3A,0xD0,0x02,0x60,0x3B,0xD7,0x2C,0x37,0x72,0x67,0x39,0xD3,0x2C,0x33,
-                0x02,0xA0,0x32,0x63,0x02,0x77,0x04,0x73,0x71,0x61,0x1D,0x61,0x16,0x30,0xF9,0x89,0x30,0x61,
-                0x31,0xD7,0x72,0x67,0x76,0x2F,0x31,0x84,0x08,0x40,0x34,0xD7,0x7E,0x07,0x2E,0xD0,0x72,0x20,
-                0x32,0x84,0x0C,0x62,0x33,0x84,0xFF,0x88,0x03,0x8B,0x01,0xE7,0x76,0x2F,0x03,0xA0,0x00,0xE4,
-                0x00,0xE7,0x76,0x2F,0x0C,0x64,0x28,0x44,0x2B,0x24,0x46,0x2F,0xD8,0x7F,0xF3,0x66,0x63,0x62,
-                0x08,0x41,0x27,0xD0,0x0C,0x31,0x13,0x63,0x32,0x63,0x00,0xE8,0x30,0x60,0x01,0x73,0x08,0x20,
-                0x20,0x89,0x0A,0x88,0x03,0x89,0x00,0x26,0x01,0x76,0xF6,0xAF,0x01,0x78,0x00,0xE0,0x00,0x26,
-                0x36,0x2F,0xF3,0x65,0x04,0x75,0xFC,0x50,0x00,0x88,0x07,0x89,0x24,0xE0,0x88,0x30,0x01,0x40,
-                0x02,0x70,0x03,0x61,0x2E,0xE0,0x14,0x0F,0xFB,0x54,0x13,0xD0,0x0B,0x40,0x56,0x2F,0xFC,0x54,
-                0x01,0x74,0x4C,0x1F,0xF6,0x63,0xF6,0x63,0xF3,0x66,0xDB,0xAF,0x00,0xE8,0x00,0xE0,0x00,0x26,
-                0xF3,0x63,0xFB,0x50,0x00,0x88,0x08,0x89,0x24,0xE0,0x88,0x30,0x01,0x40,0x02,0x70,0xFA,0x54,
-                0x4D,0x67,0x28,0x40,0x7B,0x20,0x0A,0x1F,0xFA,0x54,0x05,0xD0,0x0B,0x40,0x36,0x2F,0x04,0x7F,
-                0xF6,0x67,0x04,0xD0,0x72,0x20,0x30,0x7F,0x26,0x4F,0x0B,0x00,0x09,0x00,0x00,0x00])
-
-            try:
-                with open(self.asm_settings['game_binary'], 'rb') as f:
-                    executable = bytearray(f.read())
-            except Exception as e:
-                messagebox.showerror("Error", f"Game Binary: {e}")
-                return
-
-            executable = self.apply_apostrophe_fix(executable)
-
-            # Create backup if enabled
-            if self.asm_settings.get('backup_executable', True):
-                backup_filename = self.asm_settings['game_binary'].rsplit('.', 1)
-                backup_filename = f"{backup_filename[0]}_backup.bin"
-
-                try:
-                    with open(backup_filename, 'wb') as f:
-                        f.write(executable)
-                except Exception as e:
-                    messagebox.showerror("Error", f"Failed to create backup: {e}")
-                    return
-
-            njprint_offset = int(self.asm_settings['njprint_offset'], 16)
-            base_offset = int(self.asm_settings['executable_base_offset'], 16)
-            njprint_color_offset = int(self.asm_settings['njprint_color_offset'], 16) - base_offset
-
-            njprint_type = struct.unpack('<I', executable[njprint_color_offset:njprint_color_offset + 4])[0]
-            njcol_ptr_off = njprint_color_offset + (18 if njprint_type == 0xbd204 else 14)
-            ram_color_ptr = struct.unpack('<I', executable[njcol_ptr_off:njcol_ptr_off + 4])[0]
-
-            timer_offset = int(self.asm_settings['timer_offset'], 16)
-
-            buffer.extend(struct.pack('<I', njprint_offset))
-            buffer.extend(struct.pack('<I', ram_color_ptr))
-            buffer.extend(struct.pack('<I', timer_offset))
-
-            cursor = len(buffer)
-
-            all_scenes_data = self.scenes
-
-            unique_colors_set = set()
-            unique_texts = {0: b'\x00'}
-            text_to_id = {b'': 0}
-
-            for scene_subs in all_scenes_data.values():
-                for sub in scene_subs:
-                    color = sub.get('color', 'ffbfbfbf')
-                    text_bytes = sub['text'].encode('utf-8')
-
-                    if text_bytes not in text_to_id:
-                        text_id = len(unique_texts)
-                        unique_texts[text_id] = text_bytes + b'\x00'
-                        text_to_id[text_bytes] = text_id
-
-                    unique_colors_set.add(color)
-
-            unique_colors = {color: idx for idx, color in enumerate(sorted(unique_colors_set))}
-
-            num_scenes = len(all_scenes_data)
-
-            ptr_ptr_sequence_offset = cursor
-            buffer.extend(b'\x00' * 4)
-            cursor += 4
-
-            ptr_ptr_time_values_offset = cursor
-            buffer.extend(b'\x00' * 4)
-            cursor += 4
-
-            ptr_ptr_subs_text_offset = cursor
-            buffer.extend(b'\x00' * 4)
-            cursor += 4
-
-            ptr_color_table_offset = cursor
-            buffer.extend(b'\x00' * 4)
-            cursor += 4
-
-            padding = (4 - (cursor % 4)) % 4
-            buffer.extend(b'\x00' * padding)
-            cursor += padding
-
-            ptr_sequence_array_offset = cursor
-            buffer.extend(b'\x00' * (num_scenes * 4))
-            cursor += num_scenes * 4
-
-            ptr_time_values_array_offset = cursor
-            buffer.extend(b'\x00' * (num_scenes * 4))
-            cursor += num_scenes * 4
-
-            ptr_subs_text_array_offset = cursor
-            buffer.extend(b'\x00' * (len(unique_texts) * 4))
-            cursor += len(unique_texts) * 4
-
-            sequence_offsets = {}
-            time_value_offsets = {}
-            game_fps = int(self.asm_settings.get('game_fps', '60'))
-
-            for scene_idx in sorted(all_scenes_data.keys()):
-                scene_subs = all_scenes_data[scene_idx]
-
-                if not scene_subs:
-                    padding = (4 - (cursor % 4)) % 4
-                    buffer.extend(b'\x00' * padding)
-                    cursor += padding
-                    sequence_offsets[scene_idx] = cursor
-                    buffer.extend(struct.pack('BBBB', 0, 0, 0, 0))
-                    cursor += 4
-
-                    padding = (4 - (cursor % 4)) % 4
-                    buffer.extend(b'\x00' * padding)
-                    cursor += padding
-                    time_value_offsets[scene_idx] = cursor
-                    buffer.extend(struct.pack('<H', 0xFFFF))
-                    cursor += 2
-
-                    padding = (4 - (cursor % 4)) % 4
-                    buffer.extend(b'\x00' * padding)
-                    cursor += padding
-                    continue
-
-                events = []
-                for local_idx, sub in enumerate(scene_subs):
-                    events.append((sub['start'], local_idx, 'start'))
-                    events.append((sub['end'], local_idx, 'end'))
-                events.sort()
-
-                state_changes = [(0, ())]
-                active_subs = set()
-
-                for time, sub_idx, evt_type in events:
-                    if evt_type == 'start':
-                        active_subs.add(sub_idx)
-                    else:
-                        active_subs.discard(sub_idx)
-                    state_changes.append((time, tuple(sorted(active_subs))))
-
-                if state_changes[-1][1]:
-                    state_changes.append((state_changes[-1][0], ()))
-
-                padding = (4 - (cursor % 4)) % 4
-                buffer.extend(b'\x00' * padding)
-                cursor += padding
-
-                sequence_offsets[scene_idx] = cursor
-
-                for time, active_set in state_changes:
-                    if active_set:
-                        for sub_idx in active_set:
-                            sub = scene_subs[sub_idx]
-                            text_bytes = sub['text'].encode('utf-8')
-                            text_id = text_to_id[text_bytes]
-                            color = sub.get('color', 'ffbfbfbf')
-                            color_id = unique_colors[color]
-                            y = sub.get('y', 0) & 0xFF
-                            x_val = sub.get('x', 0)
-                            if sub.get('auto_center', True):
-                                x = 0xFF
-                            else:
-                                x = x_val & 0xFF
-                            buffer.extend(struct.pack('BBBB', text_id, color_id, y, x))
-                            cursor += 4
-                    else:
-                        buffer.extend(struct.pack('BBBB', 0, 0, 0, 0))
-                        cursor += 4
-
-                padding = (4 - (cursor % 4)) % 4
-                buffer.extend(b'\x00' * padding)
-                cursor += padding
-
-                time_value_offsets[scene_idx] = cursor
-
-                for time, active_set in state_changes[1:]:
-                    game_ticks = (time * game_fps) // 1000
-                    if game_ticks > 0xFFFE:
-                        game_ticks = 0xFFFE
-                    buffer.extend(struct.pack('<H', game_ticks))
-                    cursor += 2
-
-                buffer.extend(struct.pack('<H', 0xFFFF))
-                cursor += 2
-
-                padding = (4 - (cursor % 4)) % 4
-                buffer.extend(b'\x00' * padding)
-                cursor += padding
-
-            padding = (4 - (cursor % 4)) % 4
-            buffer.extend(b'\x00' * padding)
-            cursor += padding
-
-            colors_offset = cursor
-            for color in sorted(unique_colors.keys()):
-                color_val = int(color, 16)
-                buffer.extend(struct.pack('<I', color_val))
-                cursor += 4
-
-            padding = (4 - (cursor % 4)) % 4
-            buffer.extend(b'\x00' * padding)
-            cursor += padding
-
-            text_offsets = {}
-            for text_id in sorted(unique_texts.keys()):
-                padding = (4 - (cursor % 4)) % 4
-                buffer.extend(b'\x00' * padding)
-                cursor += padding
-
-                text_offsets[text_id] = cursor
-                text_bytes = unique_texts[text_id]
-                buffer.extend(text_bytes)
-                cursor += len(text_bytes)
-
-            empty_space_offset = int(self.asm_settings['empty_space_offset'], 16)
-            empty_space_end = int(self.asm_settings['empty_space_end'], 16)
-            base_offset_val = int(self.asm_settings['executable_base_offset'], 16)
-
-            write_offset = empty_space_offset - base_offset_val
-
-            available_space = empty_space_end - empty_space_offset
-            final_buffer_length = len(buffer)
-
-            if final_buffer_length > available_space:
-                messagebox.showerror("Error",
-                                     f"Buffer exceeds available space. Need {final_buffer_length} bytes, but only have {available_space} bytes available ({hex(empty_space_offset)} to {hex(empty_space_end)})")
-                return
-
-            ptr_sequence_array_addr = (empty_space_offset + ptr_sequence_array_offset) & 0xFFFFFFFF
-            ptr_time_values_array_addr = (empty_space_offset + ptr_time_values_array_offset) & 0xFFFFFFFF
-            ptr_subs_text_array_addr = (empty_space_offset + ptr_subs_text_array_offset) & 0xFFFFFFFF
-            colors_addr = (empty_space_offset + colors_offset) & 0xFFFFFFFF
-
-            buffer[ptr_ptr_sequence_offset:ptr_ptr_sequence_offset + 4] = struct.pack('<I', ptr_sequence_array_addr)
-            buffer[ptr_ptr_time_values_offset:ptr_ptr_time_values_offset + 4] = struct.pack('<I',
-                                                                                            ptr_time_values_array_addr)
-            buffer[ptr_ptr_subs_text_offset:ptr_ptr_subs_text_offset + 4] = struct.pack('<I', ptr_subs_text_array_addr)
-            buffer[ptr_color_table_offset:ptr_color_table_offset + 4] = struct.pack('<I', colors_addr)
-
-            for scene_idx in sorted(all_scenes_data.keys()):
-                offset = ptr_sequence_array_offset + (scene_idx * 4)
-                seq_addr = (empty_space_offset + sequence_offsets[scene_idx]) & 0xFFFFFFFF
-                buffer[offset:offset + 4] = struct.pack('<I', seq_addr)
-
-            for scene_idx in sorted(all_scenes_data.keys()):
-                offset = ptr_time_values_array_offset + (scene_idx * 4)
-                time_addr = (empty_space_offset + time_value_offsets[scene_idx]) & 0xFFFFFFFF
-                buffer[offset:offset + 4] = struct.pack('<I', time_addr)
-
-            for text_id in sorted(unique_texts.keys()):
-                offset = ptr_subs_text_array_offset + (text_id * 4)
-                text_addr = (empty_space_offset + text_offsets[text_id]) & 0xFFFFFFFF
-                buffer[offset:offset + 4] = struct.pack('<I', text_addr)
-
-            padded_buffer = buffer + bytearray([0x00] * (available_space - final_buffer_length))
-
-            if write_offset + len(padded_buffer) > len(executable):
-                messagebox.showerror("Error",
-                                     f"Padded buffer would exceed executable size. Need {write_offset + len(padded_buffer)} bytes, but executable is only {len(executable)} bytes")
-                return
-
-            executable[write_offset:write_offset + len(padded_buffer)] = padded_buffer
-
-            output_file = self.asm_settings['game_binary']
-            try:
-                with open(output_file, 'wb') as f:
-                    f.write(executable)
-                progress_window.destroy()
-                messagebox.showinfo("Success", f"Successfully patched:\n {output_file}")
-            except Exception as e:
-                progress_window.destroy()
-                messagebox.showerror("Error", f"Failed to write patched executable: {e}")
-                import traceback
-                traceback.print_exc()
-
+            output_file = compiler.build_project(self.current_project(), font_fix=self.confirm_font_fix,
+                                                 cache=self.current_cache(), stats=stats)
+            msg = f"Successfully patched:\n {output_file}"
+            if (self.asm_settings['empty_space_offset'], self.asm_settings['empty_space_end']) != window:
+                msg += (f"\n\nEmpty space window is now {self.asm_settings['empty_space_offset']} to "
+                        f"{self.asm_settings['empty_space_end']}, save the project to keep it")
+            if stats.get('merged_states'):
+                msg += f"\n\nMerged {stats['merged_states']} redundant states, {stats['states']} emitted"
+            if 'cache_error' in stats:
+                msg += f"\n\nCompile cache not saved: {stats['cache_error']}"
+            messagebox.showinfo("Success", msg)
+        except compiler.CompileError as e:
+            messagebox.showerror("Error", str(e))
         except Exception as e:
-            progress_window.destroy()
             messagebox.showerror("Error", f"Failed to export: {e}")
             import traceback
             traceback.print_exc()
 
 
 if __name__ == "__main__":
+    # Bulk import parses in worker processes, which the frozen build must support
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = njSubs_Editor(root)
     root.mainloop()
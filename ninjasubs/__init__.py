@@ -0,0 +1,7 @@
+""" - NINJASUBS core -
+Headless subtitle compiler and tools shared by the editor and the command line.
+Nothing in this package imports tkinter. """
+
+from .compiler import CompileError, compile_project, patch_executable, build_project
+from .project import load_project, save_project
+from .track import Subtitle, SubtitleTrack
@@ -0,0 +1,78 @@
+""" - NINJASUBS compile cache -
+Per-scene SEQUENCE / TIME_VALUES bytes (and state counts) keyed by everything
+they are built from: each subtitle's timing, text, color and position plus the
+format settings. The bytes use the scene's own text and color ids, which the
+compiler maps to the project's when linking, so editing one scene never
+invalidates another. Keys are plain tuples, so a lookup costs one tuple hash.
+Entries can be saved next to the project file under a SHA-1 of the key, so
+the next session starts warm. """
+
+import hashlib
+import json
+import os
+
+CACHE_VERSION = 4
+
+
+def cache_path(project_path):
+    return f"{os.path.splitext(project_path)[0]}.njcache"
+
+
+def digest(key):
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+
+class SceneCache:
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.stored = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self.load()
+
+    def get(self, key, build):
+        """Cached entry for `key`, calling `build()` to make it on a miss."""
+        self.used.add(key)
+        entry = self.entries.get(key)
+        if entry is None and self.stored:
+            entry = self.stored.pop(digest(key), None)
+            if entry is not None:
+                self.entries[key] = entry
+        if entry is None:
+            self.misses += 1
+            entry = self.entries[key] = build()
+        else:
+            self.hits += 1
+        return entry
+
+    def prune(self):
+        """Drop entries not used since the last prune (edited or deleted scenes)."""
+        self.entries = {key: value for key, value in self.entries.items() if key in self.used}
+        self.stored = {}
+        self.used = set()
+
+    def load(self):
+        """Read the cache file; a missing, stale or damaged file just means a cold cache."""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') != CACHE_VERSION:
+                return
+            self.stored = {key: tuple(bytes.fromhex(part) if isinstance(part, str) else part for part in value)
+                           for key, value in data['entries'].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            self.stored = {}
+
+    def save(self):
+        """Prune, then write the cache file if the cache has one."""
+        self.prune()
+        if not self.path:
+            return
+        data = {'version': CACHE_VERSION,
+                'entries': {digest(key): [part.hex() if isinstance(part, bytes) else part for part in value]
+                            for key, value in self.entries.items()}}
+        with open(self.path, 'w') as f:
+            json.dump(data, f)
@@ -0,0 +1,171 @@
+""" - NINJASUBS command line -
+Usage: python -m ninjasubs build project.prj [--binary 1ST_READ.BIN ...] [--incremental] [--cache]
+       python -m ninjasubs undo 1ST_READ.BIN
+       python -m ninjasubs scan GDROM_DIR [--format csv]
+       python -m ninjasubs freespace 1ST_READ.BIN [--project project.prj] """
+
+import argparse
+import sys
+
+from . import scanner
+from .cache import SceneCache, cache_path
+from .compiler import CompileError, build_project, empty_space_unset, layout_project, undo_patch
+from .project import load_project, save_project
+
+
+# Settings choose_empty_space / grow_empty_space may change during a build
+WINDOW_SETTINGS = ('empty_space_offset', 'empty_space_end', 'free_space_end')
+
+
+def cmd_build(args):
+    project = load_project(args.project)
+    settings = project['asm_settings']
+    binaries = args.binary or [settings['game_binary']]
+    if args.output and len(binaries) > 1:
+        print("Error: --output can only be used with a single binary", file=sys.stderr)
+        return 2
+
+    if args.incremental and args.output:
+        print("Error: --incremental patches in place and cannot be used with --output", file=sys.stderr)
+        return 2
+
+    # A window found free in one binary may hold code or data in another
+    if empty_space_unset(settings) and len(binaries) > 1:
+        print("Error: the project has no empty space window; build one binary first to choose it, "
+              "or set it in the project", file=sys.stderr)
+        return 2
+
+    scene_cache = None
+    if args.cache or settings.get('compile_cache_file', False):
+        scene_cache = SceneCache(cache_path(args.project))
+
+    failed = 0
+    windows = set()
+    for binary in binaries:
+        # Each binary gets its own settings: the window is checked against that binary only
+        build_settings = dict(settings, game_binary=binary)
+        stats = {}
+        try:
+            output_file = build_project(dict(project, asm_settings=build_settings), output=args.output,
+                                        backup=False if args.no_backup else None,
+                                        font_fix=False if args.no_font_fix else None,
+                                        incremental=True if args.incremental else None,
+                                        cache=scene_cache, stats=stats)
+            print(f"Successfully patched: {output_file}")
+            if stats.get('merged_states'):
+                print(f"Merged {stats['merged_states']} redundant states, {stats['states']} emitted")
+            if 'cache_error' in stats:
+                print(f"Warning: compile cache not saved: {stats['cache_error']}", file=sys.stderr)
+        except CompileError as e:
+            print(f"Error: {binary}: {e}", file=sys.stderr)
+            failed += 1
+        windows.add(tuple(build_settings[k] for k in WINDOW_SETTINGS))
+
+    # Keep a chosen or widened window, so the next build patches the same place
+    window = tuple(settings[k] for k in WINDOW_SETTINGS)
+    if windows != {window}:
+        if failed or len(windows) > 1:
+            print("Warning: empty space window changed but not saved, as not every binary was patched "
+                  "in the same one", file=sys.stderr)
+            return 1
+        settings.update(zip(WINDOW_SETTINGS, windows.pop()))
+        print(f"Empty space window: {settings['empty_space_offset']} to {settings['empty_space_end']}")
+        try:
+            save_project(project, args.project)
+            print(f"Saved the window to {args.project}")
+        except OSError as e:
+            print(f"Error: window not saved to {args.project}: {e}", file=sys.stderr)
+            return 1
+    return 1 if failed else 0
+
+
+def cmd_undo(args):
+    failed = 0
+    for binary in args.binary:
+        try:
+            count = undo_patch(binary)
+            print(f"Restored {count} ranges in {binary}")
+        except (CompileError, OSError) as e:
+            print(f"Error: {binary}: {e}", file=sys.stderr)
+            failed += 1
+    return 1 if failed else 0
+
+
+def cmd_scan(args):
+    extensions = args.ext or scanner.BINARY_EXTENSIONS
+    reports = scanner.batch_scan(args.paths, base_offset=int(args.base, 16), workers=args.jobs,
+                                 extensions=extensions)
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            scanner.write_report(reports, f, args.format)
+    else:
+        scanner.write_report(reports, sys.stdout, args.format)
+    return 0
+
+
+def cmd_freespace(args):
+    min_size = args.min_size
+    base_offset = int(args.base, 16)
+    if args.project:
+        project = load_project(args.project)
+        project['asm_settings']['game_binary'] = args.binary
+        base_offset = int(project['asm_settings']['executable_base_offset'], 16)
+        try:
+            min_size = layout_project(project).size
+        except CompileError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        print(f"Subtitle blob needs {min_size} bytes")
+
+    candidates = scanner.scan_free_space(args.binary, min_size)
+    if not candidates:
+        print(f"No free space of {min_size} bytes found", file=sys.stderr)
+        return 1
+    for c in candidates[:args.top]:
+        print(f"0x{c.offset + base_offset:08X} - 0x{c.offset + c.length + base_offset:08X}  "
+              f"{c.length:8d} bytes  fill 0x{c.fill:02X}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='ninjasubs', description="NinjaSubs headless tools")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('build', help="compile a project and patch its game binary")
+    p.add_argument('project', help=".prj project file")
+    p.add_argument('--binary', action='append',
+                   help="game binary to patch instead of the project's one (repeatable)")
+    p.add_argument('-o', '--output', help="write the patched binary here instead of in place")
+    p.add_argument('--no-backup', action='store_true', help="do not write <binary>_backup.bin")
+    p.add_argument('--no-font-fix', action='store_true', help="skip the apostrophe font fix")
+    p.add_argument('--incremental', action='store_true',
+                   help="patch in place, writing only bytes that differ (an edit can still move every table "
+                        "after it), and keep an undo record instead of a backup")
+    p.add_argument('--cache', action='store_true',
+                   help="reuse compiled scenes from <project>.njcache and update it")
+    p.set_defaults(func=cmd_build)
+
+    p = sub.add_parser('undo', help="revert the last incremental patch using its .njundo record")
+    p.add_argument('binary', nargs='+', help="patched game binary")
+    p.set_defaults(func=cmd_undo)
+
+    p = sub.add_parser('scan', help="scan binaries or extracted disc trees for njPrint/njPrintColor")
+    p.add_argument('paths', nargs='+', help="files or directories (searched recursively)")
+    p.add_argument('--format', choices=['json', 'csv'], default='json')
+    p.add_argument('-o', '--output', help="write the report here instead of stdout")
+    p.add_argument('-j', '--jobs', type=int, help="worker processes (default: all cores)")
+    p.add_argument('--ext', action='append', help="file extension to scan in directories (repeatable, "
+                                                  "default: .BIN and .OVL)")
+    p.add_argument('--base', default='0x8c010000', help="load address used for the reported offsets")
+    p.set_defaults(func=cmd_scan)
+
+    p = sub.add_parser('freespace', help="list padding runs that can hold the subtitle blob")
+    p.add_argument('binary', help="game binary")
+    p.add_argument('--project', help="size the search for this project's compiled blob")
+    p.add_argument('--min-size', type=int, default=256, help="smallest run to list (default 256)")
+    p.add_argument('--top', type=int, default=10, help="number of candidates to show")
+    p.add_argument('--base', default='0x8c010000', help="load address used for the reported offsets")
+    p.set_defaults(func=cmd_freespace)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
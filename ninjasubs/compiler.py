@@ -0,0 +1,768 @@
+""" - NINJASUBS compiler -
+Turns a project (scenes, scene names and ASM settings) into the NJ_SUBS blob
+and patches it into the game executable. No GUI code lives here: the editor and
+the command line both drive these functions. """
+
+import mmap
+import os
+import struct
+
+from . import runtime, scanner, textpool, wrap
+
+# Replacement bytes for the apostrophe font signatures in scanner.FONT_SIGNATURES.
+FONT_FIXES = {
+    'V1': bytes.fromhex('16 29 28 07 00 00 15 02 00 00 00 00 22 01 00 00 00 00 00 00'),
+    'V2': bytes.fromhex(
+        'FF FF CE B9 CE B9 CE B9 CE B9 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00'),
+}
+
+
+# Line table entry: line text pointer, Y offset, centered X (read as one word X << 16 | Y)
+LINE_ENTRY = struct.Struct('<IHH')
+POINTER = struct.Struct('<I')
+# Least room an automatically chosen empty space window leaves to grow
+EMPTY_SPACE_HEADROOM = 0x400
+_ZEROS = bytes(0x10000)
+
+
+class CompileError(Exception):
+    pass
+
+
+def _align4(size):
+    return (size + 3) & ~3
+
+
+def _place(placed, data, size):
+    """(offset, new size) for `data` in a blob of `size` bytes so far: appended
+    4-byte aligned unless an identical block was placed before; `placed` maps
+    blocks to offsets."""
+    offset = placed.get(data)
+    if offset is None:
+        offset = placed[data] = _align4(size)
+        size = offset + len(data)
+    return offset, size
+
+
+def _zero(target, start, end):
+    """Clear target[start:end] without allocating a buffer of that size."""
+    zeros = memoryview(_ZEROS)
+    for pos in range(start, end, len(zeros)):
+        n = min(len(zeros), end - pos)
+        target[pos:pos + n] = zeros[:n]
+
+
+def read_executable(settings):
+    try:
+        with open(settings['game_binary'], 'rb') as f:
+            return bytearray(f.read())
+    except Exception as e:
+        raise CompileError(f"Game Binary: {e}")
+
+
+def find_font_fix(executable, confirm=None):
+    """Return (offset, replacement) for the first apostrophe font variant found
+    and accepted by `confirm(name)`, or None."""
+    hits = scanner.scan_buffer(executable, scanner.FONT_SIGNATURES)
+    for name, replacement in FONT_FIXES.items():
+        offsets = [hit.offset for hit in hits if hit.variant == name]
+        if offsets and (confirm is None or confirm(name)):
+            return offsets[0], replacement
+    return None
+
+
+def apply_font_fix(executable, confirm=None):
+    fix = find_font_fix(executable, confirm)
+    if fix:
+        idx, replacement = fix
+        executable[idx:idx + len(replacement)] = replacement
+    return fix
+
+
+def read_color_pointer(settings, executable):
+    base_offset = int(settings['executable_base_offset'], 16)
+    njprint_color_offset = int(settings['njprint_color_offset'], 16) - base_offset
+
+    njprint_type = struct.unpack('<I', executable[njprint_color_offset:njprint_color_offset + 4])[0]
+    njcol_ptr_off = njprint_color_offset + (18 if njprint_type == 0xbd204 else 14)
+    return struct.unpack('<I', executable[njcol_ptr_off:njcol_ptr_off + 4])[0]
+
+
+def build_state_changes(scene_subs):
+    events = []
+    for local_idx, sub in enumerate(scene_subs):
+        events.append((sub['start'], local_idx, 'start'))
+        events.append((sub['end'], local_idx, 'end'))
+    events.sort()
+
+    state_changes = [(0, ())]
+    active_subs = set()
+
+    for time, sub_idx, evt_type in events:
+        if evt_type == 'start':
+            active_subs.add(sub_idx)
+        else:
+            active_subs.discard(sub_idx)
+        state_changes.append((time, tuple(sorted(active_subs))))
+
+    if state_changes[-1][1]:
+        state_changes.append((state_changes[-1][0], ()))
+    return state_changes
+
+
+def encode_time_values(ticks, time_format='u16'):
+    """TIME_VALUES table for `ticks` (ascending), end marker included."""
+    layout = runtime.TIME_FORMATS[time_format]
+    values = [min(tick, layout['max_ticks']) for tick in ticks] + [layout['end']]
+    if time_format == 'u16':
+        return struct.pack(f'<{len(values)}H', *values)
+    if time_format == 'u32':
+        return struct.pack(f'<{len(values)}I', *values)
+    out = bytearray()
+    previous = 0
+    for value in values:
+        delta = value - previous
+        previous = value
+        while delta >= 0x80:
+            out.append(0x80 | (delta & 0x7F))
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+
+def split_lines(text, line_width):
+    """(line, y offset, centered X) of each line of `text` (bytes) njPrint has
+    to draw; empty lines only move the lines below them down."""
+    return [(line, y, wrap.centered_x(line.decode('utf-8'), line_width))
+            for y, line in enumerate(text.split(b'\n')) if line]
+
+
+def minimize_states(states, ticks):
+    """Canonical state table: states[i] is shown up to and including ticks[i]
+    (the last one to the end of the scene). States no tick falls into are
+    dropped and neighbours that draw the same are merged, which leaves what
+    the runtime shows at every tick unchanged. Returns (states, ticks)."""
+    kept_states = []
+    kept_ticks = []
+    for state, tick in zip(states, list(ticks) + [None]):
+        if kept_ticks and tick is not None and tick == kept_ticks[-1]:
+            continue
+        if kept_states and state == kept_states[-1]:
+            kept_ticks[-1] = tick
+            continue
+        kept_states.append(state)
+        kept_ticks.append(tick)
+    return kept_states, kept_ticks[:-1]
+
+
+def compile_scene(scene_subs, text_to_id, unique_colors, game_fps, record, time_format='u16', multi_cue=0xFF):
+    """SEQUENCE records (packed with the struct `record`) and TIME_VALUES table
+    of one scene, plus the number of states and how many more minimize_states
+    merged away. There is one record per state; a state showing several cues
+    gets a `multi_cue` record pointing at their records, stored after the
+    per-state ones."""
+    if not scene_subs:
+        return bytes(record.size), encode_time_values([], time_format), 1, 0
+
+    def pack(sub):
+        text_id = text_to_id[sub['text'].encode('utf-8')]
+        if not text_id:
+            # Nothing to draw: same record as an empty state, whatever the color and position
+            return bytes(record.size)
+        color_id = unique_colors[sub.get('color', 'ffbfbfbf')]
+        y = sub.get('y', 0) & 0xFF
+        if sub.get('auto_center', True):
+            x = 0xFF
+        else:
+            x = sub.get('x', 0) & 0xFF
+        return record.pack(text_id, color_id, y, x)
+
+    # Quantize to game ticks first: states sharing a tick are never shown.
+    state_changes = build_state_changes(scene_subs)
+    records = [pack(sub) for sub in scene_subs]
+    max_ticks = runtime.TIME_FORMATS[time_format]['max_ticks']
+    states, ticks = minimize_states([tuple(records[i] for i in active_set) for _, active_set in state_changes],
+                                    [min((time * game_fps) // 1000, max_ticks) for time, _ in state_changes[1:]])
+
+    sequence = bytearray()
+    cues = bytearray()
+    cues_offset = len(states) * record.size
+    for state in states:
+        if len(state) > 1:
+            if len(state) > 0xFF:
+                raise CompileError(f"{len(state)} subtitles on screen at once, at most 255 are supported")
+            offset = cues_offset + len(cues) - len(sequence)
+            if offset > 0xFFFF:
+                raise CompileError("Scene has too many overlapping subtitles for one SEQUENCE table")
+            sequence.extend(record.pack(multi_cue, len(state), offset & 0xFF, offset >> 8))
+            for cue in state:
+                cues.extend(cue)
+        elif state:
+            sequence.extend(state[0])
+        else:
+            sequence.extend(bytes(record.size))
+    sequence.extend(cues)
+
+    return (bytes(sequence), encode_time_values(ticks, time_format), len(states),
+            len(state_changes) - len(states))
+
+
+def local_ids(rows):
+    """Text and color ids of one scene on its own, from its cache key rows:
+    ({text: id}, {color: id}) numbered as compile_project numbers a project."""
+    texts = {b'': 0}
+    for row in rows:
+        texts.setdefault(row[2], len(texts))
+    colors = {color: idx for idx, color in enumerate(sorted({row[3] for row in rows}))}
+    return texts, colors
+
+
+def relink_sequence(sequence, record, multi_cue, text_map, color_map):
+    """SEQUENCE bytes compiled with local ids, rewritten with the project's ids
+    (local id i becomes text_map[i] / color_map[i]). Multi-cue records and
+    empty records are kept as they are."""
+    if all(i == j for i, j in enumerate(text_map)) and all(i == j for i, j in enumerate(color_map)):
+        return sequence
+    out = bytearray(len(sequence))
+    for i, (text_id, color_id, y, x) in enumerate(record.iter_unpack(sequence)):
+        if text_id and text_id != multi_cue:
+            text_id, color_id = text_map[text_id], color_map[color_id]
+        record.pack_into(out, i * record.size, text_id, color_id, y, x)
+    return bytes(out)
+
+
+class BlobLayout:
+    """Where every section of an NJ_SUBS blob goes, as worked out by
+    layout_project. `size` is known before a byte is written; write() then
+    packs the sections straight into the target buffer."""
+
+    def __init__(self, origin):
+        self.origin = origin
+        self.size = 0
+        self.code = b''
+        self.ptr_sequence_array_offset = self.ptr_time_values_array_offset = self.ptr_subs_text_array_offset = 0
+        # scene -> (SEQUENCE offset, TIME_VALUES offset); table bytes -> offset
+        self.scene_offsets = {}
+        self.tables = {}
+        self.colors_offset = 0
+        self.colors = []
+        self.text_lines = []
+        self.table_offsets = []
+        self.line_offsets = {}
+        self.text_pairs_offset = 0
+        self.text_pairs = b''
+        self.pool_offset = 0
+        self.pool = b''
+
+    def addr(self, offset):
+        return (self.origin + offset) & 0xFFFFFFFF
+
+    def write(self, target, clear=True):
+        """Pack the blob into `target`, any writable buffer of at least `size`
+        bytes (a bytearray, or a memoryview of the executable's empty space
+        window). With `clear`, bytes of target the blob leaves as padding are
+        zeroed; pass False for a freshly allocated buffer."""
+        if clear:
+            _zero(target, 0, len(target))
+        target[:len(self.code)] = self.code
+        for scene_idx, (sequence_offset, time_values_offset) in self.scene_offsets.items():
+            POINTER.pack_into(target, self.ptr_sequence_array_offset + scene_idx * 4, self.addr(sequence_offset))
+            POINTER.pack_into(target, self.ptr_time_values_array_offset + scene_idx * 4,
+                              self.addr(time_values_offset))
+        for data, offset in self.tables.items():
+            target[offset:offset + len(data)] = data
+        for i, color in enumerate(self.colors):
+            POINTER.pack_into(target, self.colors_offset + i * 4, int(color, 16))
+
+        for text_id, lines in enumerate(self.text_lines):
+            offset = self.table_offsets[text_id]
+            POINTER.pack_into(target, self.ptr_subs_text_array_offset + text_id * 4, self.addr(offset))
+            for line, y, x in lines:
+                LINE_ENTRY.pack_into(target, offset, self.addr(self.line_offsets[line]), y, x)
+                offset += LINE_ENTRY.size
+
+        target[self.text_pairs_offset:self.text_pairs_offset + len(self.text_pairs)] = self.text_pairs
+        target[self.pool_offset:self.pool_offset + len(self.pool)] = self.pool
+        return target
+
+
+def layout_project(project, executable=None, cache=None, stats=None):
+    """First pass of the build: compile the scene tables and text pool of
+    `project` and give every section of the blob its offset. Returns a
+    BlobLayout; sizing the blob needs nothing more. `cache` and `stats` are
+    as for compile_project."""
+    settings = project['asm_settings']
+    scenes = project['scenes']
+
+    if executable is None:
+        executable = read_executable(settings)
+
+    try:
+        njprint_offset = int(settings['njprint_offset'], 16)
+        ram_color_ptr = read_color_pointer(settings, executable)
+        timer_offset = int(settings['timer_offset'], 16)
+        empty_space_offset = int(settings['empty_space_offset'], 16)
+        game_fps = int(settings.get('game_fps', '60'))
+        line_width = int(settings.get('line_width', runtime.DEFAULT_LINE_WIDTH))
+    except (ValueError, struct.error) as e:
+        raise CompileError(f"Invalid ASM settings: {e}")
+
+    runtime_name = settings.get('runtime', 'classic')
+    sequence_format = settings.get('sequence_format', 'compact')
+    text_encoding = settings.get('text_encoding', 'plain')
+    time_format = settings.get('time_format', 'u16')
+    if not 1 <= line_width <= runtime.MAX_LINE_WIDTH:
+        raise CompileError(f"Line width must be between 1 and {runtime.MAX_LINE_WIDTH} bytes")
+    try:
+        code_size = len(runtime.assemble_runtime(runtime_name, empty_space_offset, sequence_format=sequence_format,
+                                                 text_encoding=text_encoding, time_format=time_format))
+    except ValueError as e:
+        raise CompileError(str(e))
+    layout = runtime.SEQUENCE_FORMATS[sequence_format]
+    record = struct.Struct(layout['record'])
+
+    unique_colors_set = set()
+    unique_texts = [b'']
+    text_to_id = {b'': 0}
+
+    scene_rows = {}
+
+    for scene_idx, scene_subs in scenes.items():
+        rows = []
+        for sub in scene_subs:
+            text_bytes = sub['text'].encode('utf-8')
+            if text_bytes not in text_to_id:
+                text_to_id[text_bytes] = len(unique_texts)
+                unique_texts.append(text_bytes)
+            color = sub.get('color', 'ffbfbfbf')
+            unique_colors_set.add(color)
+            if cache is not None:
+                rows.append((sub['start'], sub['end'], text_bytes, color, sub.get('y', 0),
+                             sub.get('x', 0), sub.get('auto_center', True)))
+        scene_rows[scene_idx] = tuple(rows)
+
+    unique_colors = {color: idx for idx, color in enumerate(sorted(unique_colors_set))}
+
+    if len(unique_texts) - 1 > layout['max_text_id']:
+        hint = " Switch the sequence format to 'wide' for 16-bit text ids." if sequence_format == 'compact' else ''
+        raise CompileError(f"{len(unique_texts) - 1} unique texts, the '{sequence_format}' sequence format "
+                           f"holds at most {layout['max_text_id']}.{hint}")
+    for text in unique_texts:
+        line = max(text.split(b'\n'), key=len)
+        if len(line) > runtime.MAX_LINE_WIDTH:
+            raise CompileError(f"Line '{line.decode('utf-8', 'replace')}' is {len(line)} bytes, lines can be at "
+                               f"most {runtime.MAX_LINE_WIDTH}")
+    if len(unique_colors) > 0x100:
+        raise CompileError(f"{len(unique_colors)} unique colors, at most 256 are supported")
+
+    blob = BlobLayout(empty_space_offset)
+    num_scenes = len(scenes)
+    size = _align4(code_size)
+
+    blob.ptr_sequence_array_offset = size
+    size += num_scenes * 4
+    blob.ptr_time_values_array_offset = size
+    size += num_scenes * 4
+    blob.ptr_subs_text_array_offset = size
+    size += len(unique_texts) * 4
+
+    options = (game_fps, sequence_format, time_format)
+
+    for scene_idx in sorted(scenes.keys()):
+        scene_subs = scenes[scene_idx]
+
+        if cache is None:
+            sequence, time_values, states, merged = compile_scene(
+                scene_subs, text_to_id, unique_colors, game_fps, record, time_format, layout['multi_cue'])
+        else:
+            # Cached tables use the scene's own text and color ids, so texts or
+            # colors added to other scenes do not invalidate them.
+            local_texts, local_colors = local_ids(scene_rows[scene_idx])
+
+            def build(scene_subs=scene_subs, local_texts=local_texts, local_colors=local_colors):
+                return compile_scene(scene_subs, local_texts, local_colors, game_fps, record, time_format,
+                                     layout['multi_cue'])
+
+            sequence, time_values, states, merged = cache.get((scene_rows[scene_idx], options), build)
+            sequence = relink_sequence(sequence, record, layout['multi_cue'],
+                                       [text_to_id[text] for text in local_texts],
+                                       [unique_colors[color] for color in local_colors])
+        if stats is not None:
+            stats['states'] = stats.get('states', 0) + states
+            stats['merged_states'] = stats.get('merged_states', 0) + merged
+
+        # Scenes with identical tables (reused scripts, every empty scene) point at one copy.
+        sequence_offset, size = _place(blob.tables, sequence, size)
+        time_values_offset, size = _place(blob.tables, time_values, size)
+        blob.scene_offsets[scene_idx] = (sequence_offset, time_values_offset)
+
+    blob.colors_offset = _align4(size)
+    blob.colors = sorted(unique_colors.keys())
+    size = blob.colors_offset + len(blob.colors) * 4
+
+    # Every text becomes a table of its lines; the lines go to the pool on their own.
+    blob.text_lines = [split_lines(text, line_width) for text in unique_texts]
+    line_ids = {}
+    for lines in blob.text_lines:
+        for line, _, _ in lines:
+            line_ids.setdefault(line, len(line_ids))
+    unique_lines = list(line_ids)
+
+    for lines in blob.text_lines:
+        blob.table_offsets.append(size)
+        size += len(lines) * LINE_ENTRY.size + 4
+
+    pool_lines = unique_lines
+    decode_buffer_offset = first_code = 0
+    if text_encoding == 'bpe':
+        first_code, pairs, pool_lines = textpool.byte_pair_encode(unique_lines)
+        blob.text_pairs_offset = size
+        blob.text_pairs = bytes(byte for pair in pairs for byte in pair)
+        size += len(blob.text_pairs)
+
+    blob.pool, pool_offsets = textpool.build_pool(pool_lines)
+    blob.pool_offset = size
+    blob.line_offsets = {line: size + offset for line, offset in zip(unique_lines, pool_offsets)}
+    size += len(blob.pool)
+
+    if text_encoding == 'bpe':
+        decode_buffer_offset = size
+        size += max(map(len, unique_lines), default=0) + 1
+    blob.size = size
+
+    addr = blob.addr
+    symbols = {
+        'NJPRINT': njprint_offset, 'CURRENT_COLOR': ram_color_ptr, 'CURRENT_TIMER': timer_offset,
+        'PTR_SEQUENCE': addr(blob.ptr_sequence_array_offset),
+        'PTR_TIME_VALUES': addr(blob.ptr_time_values_array_offset),
+        'PTR_SUBS_TEXT': addr(blob.ptr_subs_text_array_offset), 'COLORS': addr(blob.colors_offset),
+        'TEXT_PAIRS': addr(blob.text_pairs_offset), 'TEXT_FIRST_CODE': first_code,
+        'DECODE_BUFFER': addr(decode_buffer_offset)}
+    blob.code = runtime.assemble_runtime(runtime_name, empty_space_offset, symbols, sequence_format, text_encoding,
+                                         time_format)
+    return blob
+
+
+def compile_project(project, executable=None, cache=None, stats=None):
+    """Build the NJ_SUBS blob for `project` as it will sit at empty_space_offset.
+    With a cache.SceneCache, scenes whose content and ids are unchanged reuse
+    their SEQUENCE / TIME_VALUES bytes and only the pointer arrays are relinked.
+    A `stats` dict gets 'states' (states emitted) and 'merged_states' (states
+    the minimizer removed) added up over all scenes. Returns a bytearray."""
+    layout = layout_project(project, executable, cache, stats)
+    return layout.write(bytearray(layout.size), clear=False)
+
+
+def patch_window(settings, size, executable_size):
+    """Return (file offset, length) of the empty space window, checking a blob
+    of `size` bytes fits."""
+    empty_space_offset = int(settings['empty_space_offset'], 16)
+    empty_space_end = int(settings['empty_space_end'], 16)
+    write_offset = empty_space_offset - int(settings['executable_base_offset'], 16)
+    available_space = empty_space_end - empty_space_offset
+
+    if size > available_space:
+        raise CompileError(
+            f"Buffer exceeds available space. Need {size} bytes, but only have {available_space} bytes "
+            f"available ({hex(empty_space_offset)} to {hex(empty_space_end)})")
+
+    if write_offset + available_space > executable_size:
+        raise CompileError(
+            f"Padded buffer would exceed executable size. Need {write_offset + available_space} bytes, "
+            f"but executable is only {executable_size} bytes")
+
+    return write_offset, available_space
+
+
+def patch_executable(project, executable, blob=None, cache=None, stats=None):
+    """Write the compiled blob into the empty space window of `executable` (in
+    place). Without a ready `blob` the project is laid out and packed straight
+    into the window, which first grows into its free run if the blob outgrew it."""
+    layout = layout_project(project, executable, cache, stats) if blob is None else None
+    size = len(blob) if layout is None else layout.size
+    grow_empty_space(project['asm_settings'], size, executable)
+    write_offset, available_space = patch_window(project['asm_settings'], size, len(executable))
+    with memoryview(executable)[write_offset:write_offset + available_space] as window:
+        if layout is None:
+            window[:size] = blob
+            _zero(window, size, available_space)
+        else:
+            layout.write(window)
+    return executable
+
+
+def empty_space_unset(settings):
+    try:
+        return int(settings['empty_space_end'], 16) <= int(settings['empty_space_offset'], 16)
+    except (KeyError, ValueError):
+        return True
+
+
+def _window_size(needed, align=4):
+    """Bytes to claim for a blob of `needed` bytes: a quarter more (at least
+    EMPTY_SPACE_HEADROOM) so a few added subtitles still fit, rounded up to `align`."""
+    size = needed + max(needed // 4, EMPTY_SPACE_HEADROOM)
+    return -(-size // align) * align
+
+
+def claim_free_space(space, needed, base_offset):
+    """(start, end, run end) addresses of an empty space window at the start of
+    the free run `space`, sized by _window_size. The rest of the run is left as
+    it is in the executable; its end is kept (free_space_end) so the window
+    can grow into it later."""
+    start = space.offset + base_offset
+    return start, start + min(_window_size(needed), space.length), start + space.length
+
+
+def grow_empty_space(settings, needed, executable):
+    """Extend the empty space window of `settings` when a blob of `needed` bytes
+    outgrew it, into the rest of the free run it was claimed from, as long as
+    those bytes are still uniform 0x00 / 0xFF padding. Returns True if the
+    window changed."""
+    try:
+        base_offset = int(settings['executable_base_offset'], 16)
+        start = int(settings['empty_space_offset'], 16)
+        end = int(settings['empty_space_end'], 16)
+        run_end = int(settings.get('free_space_end', '0x00000000'), 16)
+    except (KeyError, ValueError):
+        return False
+    if needed <= end - start or run_end <= end:
+        return False
+    new_end = min(start + _window_size(needed), run_end)
+    extension = executable[end - base_offset:new_end - base_offset]
+    if (len(extension) != new_end - end or extension[0] not in (0x00, 0xFF)
+            or extension.count(extension[:1]) != len(extension)):
+        return False
+    settings['empty_space_end'] = f"0x{new_end:08X}"
+    return True
+
+
+def choose_empty_space(project, executable, cache=None):
+    """Store the start of the best free run that fits the compiled blob as the
+    empty space window in the project's settings (see claim_free_space).
+    Returns the chosen scanner.FreeSpace."""
+    settings = project['asm_settings']
+    settings.setdefault('empty_space_offset', settings['executable_base_offset'])
+    needed = layout_project(project, executable, cache).size
+    candidates = scanner.find_free_space(executable, min_size=needed)
+    if not candidates:
+        raise CompileError(f"No free space found for {needed} bytes in the executable")
+    best = candidates[0]
+    start, end, run_end = claim_free_space(best, needed, int(settings['executable_base_offset'], 16))
+    settings['empty_space_offset'] = f"0x{start:08X}"
+    settings['empty_space_end'] = f"0x{end:08X}"
+    settings['free_space_end'] = f"0x{run_end:08X}"
+    return best
+
+
+def diff_ranges(old, new, base=0, gap=16):
+    """List (offset, bytes) runs where `new` differs from `old` (same length).
+    Runs closer than `gap` bytes are merged so each becomes a single write."""
+    ranges = []
+    block = 256
+    start = end = None
+    for pos in range(0, len(new), block):
+        if old[pos:pos + block] == new[pos:pos + block]:
+            continue
+        for i in range(pos, min(pos + block, len(new))):
+            if old[i] != new[i]:
+                if start is not None and i - end > gap:
+                    ranges.append((base + start, bytes(new[start:end])))
+                    start = None
+                if start is None:
+                    start = i
+                end = i + 1
+    if start is not None:
+        ranges.append((base + start, bytes(new[start:end])))
+    return ranges
+
+
+UNDO_MAGIC = b'NJUNDO\x02\x00'
+
+
+def undo_path(game_binary):
+    return f"{game_binary}.njundo"
+
+
+def write_undo_record(path, executable, writes):
+    """Save the bytes `writes` will overwrite and the bytes they write: magic,
+    file size, then (u32 offset, u32 length, original bytes, patched bytes)
+    per range."""
+    with open(path, 'wb') as f:
+        f.write(UNDO_MAGIC)
+        f.write(struct.pack('<II', len(executable), len(writes)))
+        for offset, data in writes:
+            f.write(struct.pack('<II', offset, len(data)))
+            f.write(executable[offset:offset + len(data)])
+            f.write(data)
+
+
+def remove_undo_record(game_binary):
+    """Drop the undo record of `game_binary`, which no longer describes its last patch."""
+    try:
+        os.remove(undo_path(game_binary))
+    except FileNotFoundError:
+        pass
+
+
+def read_undo_record(path):
+    """(file size, [(offset, original bytes, patched bytes)]) of an undo record."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:len(UNDO_MAGIC)] != UNDO_MAGIC:
+        raise CompileError(f"Not an undo record of this NinjaSubs version: {path}")
+    pos = len(UNDO_MAGIC)
+    size, count = struct.unpack_from('<II', data, pos)
+    pos += 8
+    ranges = []
+    for _ in range(count):
+        offset, length = struct.unpack_from('<II', data, pos)
+        pos += 8
+        ranges.append((offset, data[pos:pos + length], data[pos + length:pos + 2 * length]))
+        pos += 2 * length
+    return size, ranges
+
+
+def undo_patch(game_binary):
+    """Restore the bytes changed by the last incremental patch of `game_binary`,
+    provided the file still holds exactly what that patch wrote."""
+    record = undo_path(game_binary)
+    size, ranges = read_undo_record(record)
+    with open(game_binary, 'r+b') as f:
+        if os.fstat(f.fileno()).st_size != size:
+            raise CompileError("Executable size changed since it was patched, undo record does not apply")
+        for offset, _, patched in ranges:
+            f.seek(offset)
+            if f.read(len(patched)) != patched:
+                raise CompileError(f"Executable was changed at 0x{offset:X} since it was patched, "
+                                   f"undo record does not apply")
+        for offset, original, _ in reversed(ranges):
+            f.seek(offset)
+            f.write(original)
+    os.remove(record)
+    return len(ranges)
+
+
+def patch_incremental(project, font_fix=None, backup=None, cache=None, stats=None):
+    """Patch the game binary in place, writing only the byte ranges that differ
+    from what the binary already holds. The blob is laid out afresh, so an
+    edit that moves texts or tables still rewrites everything after it.
+    Instead of a full _backup.bin an undo record of the overwritten bytes is
+    kept next to the binary; a run that writes none drops any older record.
+    Returns (path, number of bytes written)."""
+    settings = project['asm_settings']
+    game_binary = settings['game_binary']
+    if backup is None:
+        backup = settings.get('backup_executable', True)
+
+    try:
+        f = open(game_binary, 'r+b')
+    except OSError as e:
+        raise CompileError(f"Game Binary: {e}")
+    try:
+        executable = mmap.mmap(f.fileno(), 0)
+    except (ValueError, OSError) as e:
+        f.close()
+        raise CompileError(f"Game Binary: {game_binary}: {e}")
+
+    with f, executable:
+        writes = []
+        if font_fix is not False and not settings.get('ignore_font_fix', False):
+            fix = find_font_fix(executable, font_fix)
+            if fix:
+                writes.append(fix)
+
+        if empty_space_unset(settings):
+            choose_empty_space(project, executable, cache)
+        layout = layout_project(project, executable, cache, stats)
+        grow_empty_space(settings, layout.size, executable)
+        write_offset, available_space = patch_window(settings, layout.size, len(executable))
+        window = layout.write(bytearray(available_space), clear=False)
+        with memoryview(executable)[write_offset:write_offset + available_space] as old:
+            writes.extend(diff_ranges(old, window, write_offset))
+
+        try:
+            if backup and writes:
+                write_undo_record(undo_path(game_binary), executable, writes)
+            else:
+                remove_undo_record(game_binary)
+        except Exception as e:
+            raise CompileError(f"Failed to update undo record: {e}")
+
+        try:
+            for offset, data in writes:
+                executable[offset:offset + len(data)] = data
+            executable.flush()
+        except Exception as e:
+            raise CompileError(f"Failed to write patched executable: {e}")
+
+    return game_binary, sum(len(data) for _, data in writes)
+
+
+def _save_cache(cache, stats):
+    """Save the compile cache; failing to is not a build error, so it only
+    goes into `stats` as 'cache_error'."""
+    if cache is not None:
+        try:
+            cache.save()
+        except OSError as e:
+            if stats is not None:
+                stats['cache_error'] = str(e)
+
+
+def backup_path(game_binary):
+    return f"{game_binary.rsplit('.', 1)[0]}_backup.bin"
+
+
+def build_project(project, output=None, backup=None, font_fix=None, incremental=None, cache=None, stats=None):
+    """Compile `project` and patch its game binary. Returns the path written.
+
+    `font_fix` is called with the apostrophe fix variant name ('V1'/'V2') and
+    decides whether to apply it; pass False to skip the font check entirely.
+    `incremental` (default: the 'incremental_patch' setting) patches in place
+    through patch_incremental when no separate output file is requested.
+    Without an empty space window in the settings, the best free run found in
+    the executable is chosen and stored back into them; a window the blob
+    outgrew is widened into its free run there too. A cache.SceneCache in
+    `cache` is reused across builds and saved (pruned) after each one. `stats`
+    is filled in as by compile_project, plus 'cache_error' if the cache could
+    not be saved."""
+    settings = project['asm_settings']
+    if not any(len(subs) > 0 for subs in project['scenes'].values()):
+        raise CompileError("No subtitles to save")
+
+    if incremental is None:
+        incremental = settings.get('incremental_patch', False)
+    if incremental and not output:
+        output_file = patch_incremental(project, font_fix=font_fix, backup=backup, cache=cache, stats=stats)[0]
+        _save_cache(cache, stats)
+        return output_file
+
+    executable = read_executable(settings)
+
+    if font_fix is not False and not settings.get('ignore_font_fix', False):
+        apply_font_fix(executable, font_fix)
+
+    if backup is None:
+        backup = settings.get('backup_executable', True)
+    if backup:
+        try:
+            with open(backup_path(settings['game_binary']), 'wb') as f:
+                f.write(executable)
+        except Exception as e:
+            raise CompileError(f"Failed to create backup: {e}")
+
+    if empty_space_unset(settings):
+        choose_empty_space(project, executable, cache)
+    patch_executable(project, executable, cache=cache, stats=stats)
+
+    output_file = output or settings['game_binary']
+    try:
+        with open(output_file, 'wb') as f:
+            f.write(executable)
+        if output_file == settings['game_binary']:
+            remove_undo_record(output_file)
+    except Exception as e:
+        raise CompileError(f"Failed to write patched executable: {e}")
+    _save_cache(cache, stats)
+    return output_file
@@ -0,0 +1,137 @@
+""" - NINJASUBS undo journal -
+Undo / redo for the editor, recorded as small deltas instead of project
+snapshots: field changes of one subtitle, a subtitle inserted or deleted, or
+a whole scene replaced, added or removed. Entries live in a bounded ring, and
+field changes to the same subtitle arriving in quick succession (wheel
+scrolling a time field, typing) merge into one entry.
+
+Deltas are tuples:
+    ('fields', scene, sub, {field: (old, new)})
+    ('insert', scene, sub)          ('delete', scene, sub)
+    ('scene', scene, (old subs, old name), (new subs, new name))   None = no scene
+    ('group', [deltas]) """
+
+import time
+from collections import deque
+
+DEFAULT_LIMIT = 500
+# Field edits of one subtitle closer together than this undo as one step
+COALESCE_SECONDS = 1.0
+
+
+class Journal:
+    def __init__(self, limit=DEFAULT_LIMIT):
+        self.undo_stack = deque(maxlen=limit)
+        self.redo_stack = []
+        self.group_stack = []
+        self.last_time = 0.0
+
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack = []
+        self.group_stack = []
+
+    def can_undo(self):
+        return bool(self.undo_stack)
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def record(self, delta):
+        if self.group_stack:
+            self.group_stack[-1].append(delta)
+            return
+        self.undo_stack.append(delta)
+        self.redo_stack = []
+        self.last_time = time.monotonic()
+
+    def record_fields(self, scene, sub, changes):
+        """changes: {field: (old, new)}; fields that did not change are ignored."""
+        changes = {k: v for k, v in changes.items() if v[0] != v[1]}
+        if not changes:
+            return
+        now = time.monotonic()
+        last = self.undo_stack[-1] if self.undo_stack and not self.group_stack else None
+        if (last is not None and last[0] == 'fields' and last[1] == scene and last[2] is sub
+                and last[3].keys() == changes.keys() and now - self.last_time < COALESCE_SECONDS):
+            merged = {k: (last[3][k][0], new) for k, (old, new) in changes.items()}
+            self.undo_stack.pop()
+            self.last_time = now
+            if any(old != new for old, new in merged.values()):
+                self.undo_stack.append(('fields', scene, sub, merged))
+            return
+        self.record(('fields', scene, sub, changes))
+
+    def record_insert(self, scene, sub):
+        self.record(('insert', scene, sub))
+
+    def record_delete(self, scene, sub):
+        self.record(('delete', scene, sub))
+
+    def record_scene(self, scene, old, new):
+        """old / new: (subs, name) of the scene before and after, or None."""
+        self.record(('scene', scene, old, new))
+
+    def begin_group(self):
+        self.group_stack.append([])
+
+    def end_group(self):
+        deltas = self.group_stack.pop()
+        if len(deltas) == 1:
+            self.record(deltas[0])
+        elif deltas:
+            self.record(('group', deltas))
+
+    def undo(self, scenes, scene_names):
+        """Revert the last step. Returns (scene, subtitle or None) to show, or None."""
+        if not self.undo_stack:
+            return None
+        delta = self.undo_stack.pop()
+        self.redo_stack.append(delta)
+        self.last_time = 0.0
+        return _apply(delta, scenes, scene_names, undo=True)
+
+    def redo(self, scenes, scene_names):
+        if not self.redo_stack:
+            return None
+        delta = self.redo_stack.pop()
+        self.undo_stack.append(delta)
+        self.last_time = 0.0
+        return _apply(delta, scenes, scene_names, undo=False)
+
+
+def _set_scene(scenes, scene_names, scene, state):
+    if state is None:
+        scenes.pop(scene, None)
+        scene_names.pop(scene, None)
+    else:
+        scenes[scene], scene_names[scene] = state
+
+
+def _apply(delta, scenes, scene_names, undo):
+    kind = delta[0]
+    if kind == 'group':
+        focus = None
+        for d in (reversed(delta[1]) if undo else delta[1]):
+            focus = _apply(d, scenes, scene_names, undo)
+        return focus
+    scene = delta[1]
+    if kind == 'scene':
+        state = delta[2] if undo else delta[3]
+        _set_scene(scenes, scene_names, scene, state)
+        return scene, None
+    subs = scenes[scene]
+    sub = delta[2]
+    if kind == 'fields':
+        for field, (old, new) in delta[3].items():
+            value = old if undo else new
+            if field == 'start':
+                subs.move(sub, value)
+            else:
+                sub[field] = value
+        return scene, sub
+    if (kind == 'insert') == undo:
+        subs.remove(sub)
+        return scene, None
+    subs.insert(sub)
+    return scene, sub
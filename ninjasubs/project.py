@@ -0,0 +1,287 @@
+""" - NINJASUBS project files -
+Reading and writing .prj files in the plain dict layout used by the editor and
+the compiler. A .prj is indented JSON with one dict per subtitle. A .prjz is
+an indexed file: a JSON header (settings, scene names, and where each scene
+sits) followed by every scene as its own compressed block of rows, zstd when
+the zstandard module is installed, gzip otherwise. Opened through
+open_project, a .prjz only decodes a scene when it is first accessed, and a
+save copies the blocks of scenes that were not edited as they are. Saves go
+to a temporary file that replaces the project only once it is fully written,
+so a crash mid-save leaves the previous project intact. """
+
+import gzip
+import json
+import os
+import struct
+from collections.abc import MutableMapping
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULT_ASM_SETTINGS = {
+    'game_binary': '', 'executable_base_offset': '0x8c010000',
+    'empty_space_offset': '0x8C010000', 'empty_space_end': '0x00000000', 'free_space_end': '0x00000000',
+    'njprint_offset': '0x8C010000',
+    'njprint_color_offset': '0x8C010000',
+    'timer_offset': '0x8C010000', 'base_color_argb': 'ffbfbfbf',
+    'game_fps': '60', 'backup_executable': True, 'ignore_font_fix': False, 'runtime': 'classic',
+    'incremental_patch': False, 'sequence_format': 'compact',
+    'text_encoding': 'plain', 'time_format': 'u16', 'compile_cache_file': False, 'line_width': '36'
+}
+
+COMPACT_EXTENSION = '.prjz'
+COMPACT_VERSION = 1
+# Compact layout: every subtitle is a row of these fields, missing keys take the default.
+ROW_FIELDS = (('start', 0), ('end', 0), ('text', ''), ('x', 0), ('y', 0), ('color', 'ffbfbfbf'),
+              ('opacity', 255), ('auto_center', True))
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# Indexed .prjz: magic, u32 header length, JSON header, then the scene blocks
+INDEXED_MAGIC = b'NJPRJIX1'
+_HEADER = struct.Struct('<8sI')
+
+
+def normalize_project(pd):
+    scenes = {int(k): v for k, v in pd.get('scenes', {0: []}).items()}
+    scene_names = {int(k): v for k, v in pd.get('scene_names', {}).items()}
+
+    asm_settings = dict(DEFAULT_ASM_SETTINGS)
+    asm_settings.update(pd.get('asm_settings', {}))
+
+    if not scenes:
+        scenes = {0: []}
+    return {'scenes': scenes, 'scene_names': scene_names, 'asm_settings': asm_settings}
+
+
+def _compress(data, codec):
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("Project is zstd-compressed, install the zstandard module to open it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def default_codec():
+    return 'zstd' if zstandard is not None else 'gzip'
+
+
+def scene_rows(subs):
+    return tuple(tuple(sub.get(name, default) for name, default in ROW_FIELDS) for sub in subs)
+
+
+class LazyScenes(MutableMapping):
+    """Scene number -> subtitles, decoding a scene of an indexed project on
+    first access. `factory` turns a list of subtitle dicts into what the
+    caller keeps per scene (list, SubtitleTrack, ...)."""
+
+    def __init__(self, scenes=None, factory=list):
+        self.factory = factory
+        self.path = None
+        self.codec = None
+        self.fields = None
+        self.data_start = 0
+        self.index = {}
+        self.loaded = {}
+        # Rows of each scene as decoded, to tell edited scenes from untouched ones
+        self.clean = {}
+        self.loads = 0
+        for k, subs in (scenes or {}).items():
+            self.loaded[int(k)] = subs
+
+    def __getitem__(self, k):
+        if k in self.loaded:
+            return self.loaded[k]
+        if k not in self.index:
+            raise KeyError(k)
+        rows = json.loads(_decompress(self.read_block(k), self.codec))
+        subs = self.factory([dict(zip(self.fields, row)) for row in rows])
+        self.loaded[k] = subs
+        self.clean[k] = scene_rows(subs)
+        self.loads += 1
+        return subs
+
+    def __setitem__(self, k, subs):
+        self.loaded[k] = subs
+        self.index.pop(k, None)
+        self.clean.pop(k, None)
+
+    def __delitem__(self, k):
+        if k not in self:
+            raise KeyError(k)
+        self.loaded.pop(k, None)
+        self.index.pop(k, None)
+        self.clean.pop(k, None)
+
+    def __contains__(self, k):
+        return k in self.loaded or k in self.index
+
+    def __iter__(self):
+        return iter(sorted(set(self.loaded) | set(self.index)))
+
+    def __len__(self):
+        return len(set(self.loaded) | set(self.index))
+
+    def count(self, k):
+        """Number of subtitles in scene k, without decoding it."""
+        if k in self.loaded:
+            return len(self.loaded[k])
+        return self.index[k][2]
+
+    def read_block(self, k):
+        offset, length, _ = self.index[k]
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_start + offset)
+            return f.read(length)
+
+    def unchanged_block(self, k, codec):
+        """The stored block of scene k if it can be written again as is, else None."""
+        if k not in self.index or codec != self.codec:
+            return None
+        if k in self.loaded and scene_rows(self.loaded[k]) != self.clean[k]:
+            return None
+        return self.read_block(k)
+
+
+def scene_length(scenes, k):
+    return scenes.count(k) if isinstance(scenes, LazyScenes) else len(scenes[k])
+
+
+def _read_indexed(fp, factory):
+    with open(fp, 'rb') as f:
+        _, header_length = _HEADER.unpack(f.read(_HEADER.size))
+        header = json.loads(f.read(header_length))
+    if header.get('compact', 0) > COMPACT_VERSION:
+        raise ValueError(f"Project was saved by a newer NinjaSubs (compact layout {header['compact']})")
+    scenes = LazyScenes(factory=factory)
+    scenes.path = fp
+    scenes.codec = header['codec']
+    scenes.fields = header['fields']
+    scenes.data_start = _HEADER.size + header_length
+    scenes.index = {int(k): tuple(v) for k, v in header['scenes'].items()}
+    return {'scenes': scenes, 'scene_names': header['scene_names'], 'asm_settings': header['asm_settings']}
+
+
+def from_compact(pd):
+    if pd['compact'] > COMPACT_VERSION:
+        raise ValueError(f"Project was saved by a newer NinjaSubs (compact layout {pd['compact']})")
+    fields = pd['fields']
+    pd = dict(pd)
+    pd['scenes'] = {k: [dict(zip(fields, row)) for row in rows] for k, rows in pd['scenes'].items()}
+    return pd
+
+
+def open_project(fp, factory=list):
+    """Raw project dict whose 'scenes' is a LazyScenes; only an indexed .prjz
+    actually defers decoding. Scene numbers are ints."""
+    with open(fp, 'rb') as f:
+        magic = f.read(len(INDEXED_MAGIC))
+    if magic == INDEXED_MAGIC:
+        return _read_indexed(fp, factory)
+    with open(fp, 'rb') as f:
+        data = f.read()
+    # Whole-file compressed compact projects
+    if data.startswith(GZIP_MAGIC):
+        data = _decompress(data, 'gzip')
+    elif data.startswith(ZSTD_MAGIC):
+        data = _decompress(data, 'zstd')
+    pd = json.loads(data)
+    if 'compact' in pd:
+        pd = from_compact(pd)
+    pd['scenes'] = LazyScenes({k: factory(subs) for k, subs in pd.get('scenes', {}).items()}, factory)
+    return pd
+
+
+def read_project_data(fp):
+    """The raw project dict of a .prj or .prjz file, every scene decoded."""
+    pd = open_project(fp)
+    pd['scenes'] = dict(pd['scenes'].items())
+    return pd
+
+
+def load_project(fp):
+    return normalize_project(read_project_data(fp))
+
+
+def write_atomic(fp, data):
+    """Write `data` to fp through a temporary file in the same directory."""
+    tmp = f"{fp}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, fp)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _encode_indexed(pd, codec):
+    scenes = pd['scenes']
+    lazy = isinstance(scenes, LazyScenes)
+    blocks = []
+    index = {}
+    clean = {}
+    offset = 0
+    for k in sorted(scenes):
+        block = scenes.unchanged_block(k, codec) if lazy else None
+        if block is None:
+            rows = scene_rows(scenes[k])
+            clean[k] = rows
+            block = _compress(json.dumps(rows, separators=(',', ':')).encode('utf-8'), codec)
+            count = len(rows)
+        else:
+            count = scenes.count(k)
+        index[k] = (offset, len(block), count)
+        blocks.append(block)
+        offset += len(block)
+    header = json.dumps({'compact': COMPACT_VERSION, 'codec': codec, 'fields': [name for name, _ in ROW_FIELDS],
+                         'scenes': {str(k): v for k, v in index.items()},
+                         'scene_names': pd['scene_names'], 'asm_settings': pd['asm_settings']},
+                        separators=(',', ':')).encode('utf-8')
+    data = _HEADER.pack(INDEXED_MAGIC, len(header)) + header + b''.join(blocks)
+    return data, index, clean, _HEADER.size + len(header)
+
+
+def encode_project(pd, compact=False):
+    """Bytes of a project file; `pd` scenes may hold dicts or SubtitleTracks."""
+    if compact:
+        return _encode_indexed(pd, default_codec())[0]
+    scenes = {k: [sub if isinstance(sub, dict) else sub.to_dict() for sub in subs]
+              for k, subs in pd['scenes'].items()}
+    pd = {'scenes': scenes, 'scene_names': pd['scene_names'], 'asm_settings': pd['asm_settings']}
+    return json.dumps(pd, indent=2).encode('utf-8')
+
+
+def save_project(pd, fp, compact=None):
+    """Save atomically; compact defaults to whether fp ends in .prjz. A
+    LazyScenes saved as .prjz reads its untouched scenes from the new file
+    afterwards."""
+    if compact is None:
+        compact = fp.lower().endswith(COMPACT_EXTENSION)
+    if not compact:
+        write_atomic(fp, encode_project(pd))
+        return
+    codec = default_codec()
+    data, index, clean, data_start = _encode_indexed(pd, codec)
+    write_atomic(fp, data)
+    scenes = pd['scenes']
+    if isinstance(scenes, LazyScenes):
+        scenes.path = fp
+        scenes.codec = codec
+        scenes.fields = [name for name, _ in ROW_FIELDS]
+        scenes.data_start = data_start
+        scenes.index = index
+        scenes.clean.update((k, rows) for k, rows in clean.items() if k in scenes.loaded)
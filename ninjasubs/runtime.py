@@ -0,0 +1,450 @@
+""" - NINJASUBS runtimes -
+SH4 source for the NJ_SUBS routine the compiler places in front of the subtitle
+tables. Every runtime ends with the same data section, filled in through the
+symbols listed in RUNTIME_SYMBOLS, and reads SEQUENCE records in any of the
+SEQUENCE_FORMATS through the SEQ_* field offsets and the WIDE flag, and
+TIME_VALUES in any of the TIME_FORMATS (TIME32 / DELTA flags). With the BPE
+flag each line is first expanded from the byte-pair coded text pool. Texts
+are split into lines at build time, with the AUTO-X position of every line
+precomputed, so the runtimes hand the stored lines straight to njPrint. """
+
+from .sh4 import assemble
+
+RUNTIME_SYMBOLS = ['NJPRINT', 'CURRENT_COLOR', 'CURRENT_TIMER', 'PTR_SEQUENCE', 'PTR_TIME_VALUES',
+                   'PTR_SUBS_TEXT', 'COLORS', 'TEXT_PAIRS', 'TEXT_FIRST_CODE', 'DECODE_BUFFER']
+
+# SEQUENCE record layouts (text id, color id, y, x): struct format, largest
+# text id, the MULTI_CUE text id (see _RENDER), #if flags and the field
+# offsets the runtimes read.
+SEQUENCE_FORMATS = {
+    'compact': {'record': '<BBBB', 'max_text_id': 0xFE, 'multi_cue': 0xFF, 'defines': (),
+                'symbols': {'SEQ_STRIDE': 4, 'SEQ_COLOR': 1, 'SEQ_Y': 2, 'SEQ_X': 3}},
+    'wide': {'record': '<HBBBx', 'max_text_id': 0xFFFE, 'multi_cue': 0xFFFF, 'defines': ('WIDE',),
+             'symbols': {'SEQ_STRIDE': 6, 'SEQ_COLOR': 2, 'SEQ_Y': 3, 'SEQ_X': 4}},
+}
+
+# TIME_VALUES encodings: entry size, #if flags and the end marker. 'delta'
+# entries are LEB128 differences to the previous value (see _READ_DELTA).
+TIME_FORMATS = {
+    'u16': {'size': 2, 'defines': (), 'max_ticks': 0xFFFE, 'end': 0xFFFF},
+    'u32': {'size': 4, 'defines': ('TIME32',), 'max_ticks': 0xFFFFFFFE, 'end': 0xFFFFFFFF},
+    'delta': {'size': 0, 'defines': ('DELTA',), 'max_ticks': 0xFFFFFFFE, 'end': 0xFFFFFFFF},
+}
+
+# SUBS_TEXT encodings and the #if flags they set (see textpool.py).
+TEXT_ENCODINGS = {'plain': (), 'bpe': ('BPE',)}
+
+# njPrint line width in bytes, used by the compiler for AUTO-X centering. The
+# limit is the 0x28 byte line buffer of the first runtime, kept for projects.
+DEFAULT_LINE_WIDTH = 36
+MAX_LINE_WIDTH = 0x28 - 1
+
+_DATA = """
+#align4
+
+; Data section
+
+PTR_NJPRINT:
+    #data NJPRINT
+
+PTR_CURRENT_COLOR:
+    #data CURRENT_COLOR
+
+PTR_CURRENT_TIMER:
+    #data CURRENT_TIMER
+
+PTR_PTR_SEQUENCE:
+    #data PTR_SEQUENCE
+
+PTR_PTR_TIME_VALUES:
+    #data PTR_TIME_VALUES
+
+PTR_PTR_SUBS_TEXT:
+    #data PTR_SUBS_TEXT
+
+PTR_COLOR_ID_TABLE:
+    #data COLORS
+
+#if BPE
+PTR_TEXT_PAIRS:
+    #data TEXT_PAIRS
+
+PTR_DECODE_BUFFER:
+    #data DECODE_BUFFER
+
+TEXT_FIRST_CODE_VALUE:
+    #data TEXT_FIRST_CODE
+#endif
+"""
+
+
+# Expands the byte-pair coded line at r3 into DECODE_BUFFER and points r3 at it.
+# Pairs still to expand wait on the stack above the mark in r2.
+_DECODE = """
+#if BPE
+    mov.l     @PTR_DECODE_BUFFER,r6
+    mov.l     @PTR_TEXT_PAIRS,r5
+    mov.l     @TEXT_FIRST_CODE_VALUE,r1
+    mov       r15,r2                    ; r2 = expansion stack mark
+
+decode_next:
+    mov.b     @r3+,r0
+    extu.b    r0,r0
+    tst       r0,r0
+    bt        decode_done
+
+decode_expand:
+    cmp/hs    r1,r0                     ; if byte >= first code, it is a pair
+    bf        decode_literal
+    sub       r1,r0
+    add       r0,r0
+    add       r5,r0
+    mov       r0,r7                     ; r7 = TEXT_PAIRS[code - first code]
+    mov.b     @(0x1,r7),r0
+    extu.b    r0,r0
+    mov.l     r0,@-r15                  ; push right half
+    mov.b     @r7,r0
+    bra       decode_expand
+    extu.b    r0,r0                     ; expand left half
+
+decode_literal:
+    mov.b     r0,@r6
+    add       1,r6
+    cmp/eq    r2,r15
+    bt        decode_next               ; nothing pending, read the next text byte
+    bra       decode_expand
+    mov.l     @r15+,r0                  ; pop pending half
+
+decode_done:
+    mov.b     r0,@r6                    ; terminate decoded line
+    mov.l     @PTR_DECODE_BUFFER,r3
+#endif
+"""
+
+# Shared by the runtimes: draws the SEQUENCE record at r3. SUBS_TEXT[text id]
+# points at the text's line table, split by the compiler: per line a pointer
+# to the NUL-terminated line and a word holding its centered X << 16 | Y
+# offset, ended by a null pointer. Each line goes to njPrint as it is stored.
+# A record whose text id is all ones (MULTI_CUE) stands for several cues shown
+# at once: its color byte counts the records to draw, which follow one
+# another at the record's address + (x << 8 | y).
+_RENDER = """
+    mov.l     r8,@-r15
+    mov.l     r9,@-r15
+    mov.l     r10,@-r15
+    mov.l     r11,@-r15
+    mov.l     r12,@-r15
+
+    ; Save current color to stack
+    mov.l     @PTR_CURRENT_COLOR,r7
+    mov.l     @r7,r7
+    mov.l     r7,@-r15                  ; Push current color value to stack
+
+    mov       r3,r12                    ; r12 = record to draw
+    mov       1,r11                     ; r11 = records left to draw
+#if WIDE
+    mov.w     @r12,r0
+#else
+    mov.b     @r12,r0
+#endif
+    cmp/eq    -1,r0                     ; MULTI_CUE record?
+    bf        draw_record
+    mov.b     @(SEQ_COLOR,r12),r0
+    extu.b    r0,r11                    ; r11 = number of cues
+    mov.b     @(SEQ_X,r12),r0
+    extu.b    r0,r1
+    shll8     r1
+    mov.b     @(SEQ_Y,r12),r0
+    extu.b    r0,r0
+    or        r0,r1                     ; r1 = offset of the cue records
+    add       r1,r12
+
+draw_record:
+#if WIDE
+    mov.w     @r12,r1
+    extu.w    r1,r1                     ; r1 = read sequence index uint16
+#else
+    mov.b     @r12,r1
+    extu.b    r1,r1                     ; r1 = read sequence index uint8
+#endif
+
+    ; Read color
+    mov.b     @(SEQ_COLOR,r12),r0       ; r0 = color index
+    extu.b    r0,r0
+    shll2     r0                        ; color index * 4
+    mov.l     @PTR_COLOR_ID_TABLE,r7    ; Read color table ptr
+    mov.l     @(r0,r7),r7               ; color value in r7
+    mov.l     @PTR_CURRENT_COLOR,r0
+    mov.l     r7,@r0                    ; write color value
+
+    ; Sub offset: line VH = (line word & r10) + r9
+    mov.b     @(SEQ_Y,r12),r0
+    extu.b    r0,r9                     ; r9 = y
+    mov.b     @(SEQ_X,r12),r0           ; r0 = x
+
+    ; Check if x=0xFF (AUTO-X flag)
+    cmp/eq    0xff,r0
+    bt/s      loc_after_vh_calc         ; AUTO-X: keep the centered X of each line
+    mov       -1,r10
+    extu.b    r0,r0
+    shll16    r0
+    or        r0,r9                     ; r9 = x << 16 | y
+    extu.w    r10,r10                   ; keep only the Y offset of each line
+
+loc_after_vh_calc:
+    mov.l     @PTR_PTR_SUBS_TEXT,r0     ; r0 = pointer to SUBS_TEXT table
+    shll2     r1                        ; index * 4
+    mov.l     @(r0,r1),r8               ; r8 = line table of the text
+
+print_line:
+    mov.l     @r8+,r3                   ; r3 = line text, null after the last line
+    tst       r3,r3
+    bt        lines_done
+    mov.l     @r8+,r4                   ; r4 = centered X << 16 | Y offset
+    and       r10,r4
+    add       r9,r4                     ; r4 = VH of the line
+""" + _DECODE + """
+    mov.l     @PTR_NJPRINT,r0
+    jsr       @r0                       ; _njPrint(r4=position, text on the stack)
+    mov.l     r3,@-r15                  ; PUSH TEXT POINTER IN DELAY SLOT
+    bra       print_line
+    add       0x4,r15                   ; pop text pointer
+
+lines_done:
+    dt        r11
+    bf/s      draw_record               ; next cue of a MULTI_CUE record
+    add       SEQ_STRIDE,r12
+
+    ; Restore color from stack
+    mov.l     @r15+,r7
+    mov.l     @PTR_CURRENT_COLOR,r0
+    mov.l     r7,@r0
+
+    mov.l     @r15+,r12
+    mov.l     @r15+,r11
+    mov.l     @r15+,r10
+    mov.l     @r15+,r9
+    mov.l     @r15+,r8
+    lds.l     @r15+,PR
+    rts
+    nop
+"""
+
+
+# Adds the next TIME_VALUES delta at r7 to r4 and advances r7. Deltas are
+# LEB128: 7 bits per byte, low bits first, bit 7 set on all but the last byte.
+_READ_DELTA = """
+    mov       0,r2                      ; r2 = shift
+read_delta:
+    mov.b     @r7+,r0
+    tst       0x80,r0                   ; T = last byte of the delta
+    and       0x7f,r0
+    shld      r2,r0
+    add       r0,r4
+    bf/s      read_delta
+    add       7,r2
+"""
+
+# njsubs.asm: linear TIME_VALUES scan from the start of the scene. Text and
+# color indexes are zero-extended (the first release sign-extended them, which
+# broke every text id above 127).
+CLASSIC = """
+NJ_SUBS:
+    sts.l     PR,@-r15
+    shll2     r2                        ; r2 = subs set (scene number)
+#if DELTA
+    mov.l     @PTR_CURRENT_TIMER,r5
+    mov.l     @r5,r5                    ; r5 = load CURRENT_TIMER value
+#else
+    mov.l     @PTR_CURRENT_TIMER,r0     
+    mov.l     @r0,r0                    ; r0 = load CURRENT_TIMER value
+#endif
+    mov.l     @PTR_PTR_TIME_VALUES,r7   ; r7 = pointer to TIME_VALUES table
+    add       r2,r7                     ; add subs set ID *4 for TIME_VALUES table
+    mov.l     @r7,r7
+    mov.l     @PTR_PTR_SEQUENCE,r3      ; r3 = pointer to SEQUENCE array
+    add       r2,r3                     ; add subs set ID *4 for SEQUENCE array 
+#if DELTA
+    mov.l     @r3,r3
+    mov       0,r4                      ; r4 = table value, summed from the deltas
+
+find_current_time:
+""" + _READ_DELTA + """
+    cmp/hi    r4,r5                     ; if current_timer > table_value
+    bf        found_current_time
+    bra       find_current_time
+    add       SEQ_STRIDE,r3             ; next sequence record
+
+found_current_time:
+#else
+    
+    ; Loop to find matching timer value
+    bra       find_current_time         ; Jump to loop check
+    mov.l     @r3,r3                                
+    
+advance_sequence:
+    add TIME_SIZE,r7                    ; r7 += next timer entry
+    add SEQ_STRIDE,r3                   ; r3 += 1 (next sequence index)
+    
+find_current_time:
+#if TIME32
+    mov.l     @r7,r1                    ; r1 = load current timer value from table
+#else
+    mov.w     @r7,r1                    ; r1 = load current timer value from table
+    extu.w    r1,r1                     ; r7 = value as unsigned
+#endif
+    cmp/hi    r1,r0                     ; if current_timer > table_value
+    bt        advance_sequence          ; If yes, continue the loop
+#endif
+    
+    ; Found matching time
+""" + _RENDER + _DATA
+
+
+def _load_time(reg):
+    """TIME_VALUES[r0] (table at r7) into `reg`; scales r0 to a byte offset."""
+    return f"""
+#if TIME32
+    shll2     r0
+    mov.l     @(r0,r7),{reg}
+#else
+    add       r0,r0
+    mov.w     @(r0,r7),{reg}
+    extu.w    {reg},{reg}
+#endif
+"""
+
+
+# Cached cursor: resume from last frame's TIME_VALUES index, binary search when time goes back.
+# Delta coded tables cannot be searched, so going back rescans them from the start.
+CURSOR = """
+NJ_SUBS:
+    sts.l     PR,@-r15
+    shll2     r2                        ; r2 = subs set (scene number)
+    mov.l     @PTR_CURRENT_TIMER,r5
+    mov.l     @r5,r5                    ; r5 = load CURRENT_TIMER value
+    mov.l     @PTR_PTR_TIME_VALUES,r7   ; r7 = pointer to TIME_VALUES table
+    add       r2,r7                     ; add subs set ID *4 for TIME_VALUES table
+    mov.l     @r7,r7
+    mov.l     @PTR_PTR_SEQUENCE,r3      ; r3 = pointer to SEQUENCE array
+    add       r2,r3                     ; add subs set ID *4 for SEQUENCE array
+    mov.l     @r3,r3
+
+    ; CURSOR = TIME_VALUES table and index found on the previous frame
+    mov.l     @PTR_CURSOR,r6
+    mov.l     @r6,r0
+#if DELTA
+    ; (+ pointer to the delta at index and TIME_VALUES[index - 1])
+    cmp/eq    r7,r0
+    bf        delta_restart
+    mov.l     @(0xc,r6),r4              ; r4 = TIME_VALUES[index - 1], 0 at index 0
+    cmp/hi    r4,r5                     ; if current_timer > TIME_VALUES[index - 1]
+    bf        delta_restart             ; time went backwards, rescan the table
+    mov.l     @(0x4,r6),r1              ; r1 = cached index
+    bra       delta_scan
+    mov.l     @(0x8,r6),r7              ; r7 = delta at the cached index
+
+delta_restart:
+    mov.l     r7,@r6
+    mov       0,r1
+    mov       0,r4
+
+delta_scan:
+    mov.l     r7,@(0x8,r6)
+    mov.l     r4,@(0xc,r6)
+""" + _READ_DELTA + """
+    cmp/hi    r4,r5                     ; if current_timer > table_value
+    bf        cursor_found
+    bra       delta_scan
+    add       1,r1
+#else
+    cmp/eq    r7,r0
+    bt/s      cursor_check
+    mov.l     @(0x4,r6),r1              ; r1 = cached index
+    mov.l     r7,@r6                    ; other scene: restart from index 0
+    bra       scan_forward
+    mov       0,r1
+
+cursor_check:
+    tst       r1,r1
+    bt        scan_forward
+    mov       r1,r0
+    add       -1,r0
+""" + _load_time('r4') + """
+    cmp/hi    r4,r5                     ; if current_timer > TIME_VALUES[index - 1]
+    bt        scan_forward              ; time went forward, scan on from the cursor
+
+    ; Time went backwards: binary search TIME_VALUES[0 .. index - 1]
+    mov       0,r2                      ; r2 = lo
+    add       -1,r1                     ; r1 = hi
+bsearch_loop:
+    cmp/hs    r1,r2                     ; if lo >= hi, r1 = lo = found index
+    bt        cursor_found
+    mov       r2,r4
+    add       r1,r4
+    shlr      r4                        ; r4 = mid
+    mov       r4,r0
+""" + _load_time('r0') + """
+    cmp/hi    r0,r5                     ; if current_timer > TIME_VALUES[mid]
+    bt        bsearch_upper
+    bra       bsearch_loop
+    mov       r4,r1                     ; hi = mid
+bsearch_upper:
+    mov       r4,r2
+    bra       bsearch_loop
+    add       1,r2                      ; lo = mid + 1
+
+scan_forward:
+    mov       r1,r0
+""" + _load_time('r4') + """
+    cmp/hi    r4,r5                     ; if current_timer > table_value
+    bf        cursor_found
+    bra       scan_forward
+    add       1,r1
+#endif
+
+cursor_found:
+    mov.l     r1,@(0x4,r6)              ; save index for the next frame
+#if WIDE
+    shll      r1
+    mov       r1,r0
+    shll      r1
+    add       r0,r1                     ; index * 6
+#else
+    shll2     r1                        ; index * 4
+#endif
+    add       r1,r3                     ; r3 = SEQUENCE record
+""" + _RENDER + _DATA + """
+PTR_CURSOR:
+    #data CURSOR
+
+CURSOR:
+    #data 0x00000000 0x00000000         ; TIME_VALUES table, index
+#if DELTA
+    #data 0x00000000 0x00000000         ; delta pointer, TIME_VALUES[index - 1]
+#endif
+"""
+
+RUNTIMES = {'classic': CLASSIC, 'cursor': CURSOR}
+
+
+def assemble_runtime(name, origin, symbols=None, sequence_format='compact', text_encoding='plain',
+                     time_format='u16'):
+    """Assemble runtime `name` at `origin`. Missing symbols assemble as 0, which
+    is enough to measure the runtime before the blob is laid out."""
+    if name not in RUNTIMES:
+        raise ValueError(f"Unknown runtime '{name}'")
+    if sequence_format not in SEQUENCE_FORMATS:
+        raise ValueError(f"Unknown sequence format '{sequence_format}'")
+    if text_encoding not in TEXT_ENCODINGS:
+        raise ValueError(f"Unknown text encoding '{text_encoding}'")
+    if time_format not in TIME_FORMATS:
+        raise ValueError(f"Unknown time format '{time_format}'")
+    layout = SEQUENCE_FORMATS[sequence_format]
+    values = {symbol: 0 for symbol in RUNTIME_SYMBOLS}
+    values.update(layout['symbols'])
+    values['TIME_SIZE'] = TIME_FORMATS[time_format]['size']
+    values.update(symbols or {})
+    defines = layout['defines'] + TEXT_ENCODINGS[text_encoding] + TIME_FORMATS[time_format]['defines']
+    code, _ = assemble(RUNTIMES[name], origin, values, defines)
+    return code
@@ -0,0 +1,242 @@
+""" - NINJASUBS scanner -
+Finds njPrint / njPrintColor / debug font signatures in game binaries, working
+on a memory map of the file. Signatures are hex strings where `??` matches any
+byte. Each one is located through its longest literal run (the anchor) with the
+C-speed mmap/bytes find, then checked in full, so wildcards cost nothing unless
+the anchor hits, and signatures sharing an anchor are searched for only once. """
+
+import csv
+import json
+import mmap
+import os
+import re
+import struct
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+Hit = namedtuple('Hit', ['kind', 'variant', 'offset'])
+FreeSpace = namedtuple('FreeSpace', ['offset', 'length', 'fill'])
+
+# (kind, variant, hex pattern) - `??` matches any byte.
+SIGNATURES = [
+    ('njprint', 'v1', '224f03e51d900c3f422f1b90fc3004700825'),
+    ('njprint', 'v2', '224f1e900c3f1d9003e5422ffc3004700825'),
+    ('njprint_color', 'v1', '04d20b004222'),
+    ('njprint_color', 'v2', '03d20b004222'),
+    ('font_fix', 'V1', '16 29 28 07 00 00 15 02 00 00 00 00 22 01 00 00 15 02 04 01'),
+    ('font_fix', 'V2', 'FF FF CE B9 CE B9 CE B9 CE B9 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 00 '
+                       '00 00 00 00 00 00 00 00 00 00 FF FF 00 00 00 00 CE B9 00 00 00 00 CE B9 00 00 00 00 CE B9'),
+]
+
+FONT_SIGNATURES = [s for s in SIGNATURES if s[0] == 'font_fix']
+
+# Offset of the base ARGB color after each njPrintColor variant.
+BASE_COLOR_OFFSETS = {'v1': 14, 'v2': 10}
+
+_compiled = {}
+
+
+def compile_signatures(signatures):
+    """Group signatures by anchor: {anchor: [(index, anchor offset, full regex or None)]}."""
+    key = tuple(signatures)
+    if key not in _compiled:
+        anchors = {}
+        for i, (kind, variant, pattern) in enumerate(signatures):
+            tokens = re.findall('..', pattern.replace(' ', ''))
+            length, start, run_start = 0, 0, None
+            for j, token in enumerate(tokens + ['??']):
+                if token != '??':
+                    run_start = j if run_start is None else run_start
+                    continue
+                if run_start is not None and j - run_start > length:
+                    length, start = j - run_start, run_start
+                run_start = None
+            if not length:
+                raise ValueError(f"Signature {kind}/{variant} has no literal bytes")
+            anchor = bytes.fromhex(''.join(tokens[start:start + length]))
+            regex = None
+            if '??' in tokens:
+                body = b''.join(b'.' if t == '??' else re.escape(bytes([int(t, 16)])) for t in tokens)
+                regex = re.compile(body, re.DOTALL)
+            anchors.setdefault(anchor, []).append((i, start, regex))
+        _compiled[key] = anchors
+    return _compiled[key]
+
+
+def scan_buffer(data, signatures=SIGNATURES):
+    """Every signature hit in `data` (bytes, bytearray or mmap), in file order."""
+    hits = []
+    for anchor, entries in compile_signatures(signatures).items():
+        pos = data.find(anchor)
+        while pos != -1:
+            for i, anchor_offset, regex in entries:
+                start = pos - anchor_offset
+                if start >= 0 and (regex is None or regex.match(data, start)):
+                    kind, variant, _ = signatures[i]
+                    hits.append(Hit(kind, variant, start))
+            pos = data.find(anchor, pos + 1)
+    hits.sort(key=lambda hit: hit.offset)
+    return hits
+
+
+def open_map(filepath):
+    """Read-only memory map of `filepath`, or None for an empty file."""
+    with open(filepath, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def scan_file(filepath, signatures=SIGNATURES):
+    data = open_map(filepath)
+    if data is None:
+        return []
+    with data:
+        return scan_buffer(data, signatures)
+
+
+def first_hit(hits, kind, signatures=SIGNATURES):
+    """First hit of `kind`, preferring variants in the order they are listed."""
+    for sig_kind, variant, _ in signatures:
+        if sig_kind == kind:
+            for hit in hits:
+                if hit.kind == kind and hit.variant == variant:
+                    return hit
+    return None
+
+
+def summarize(hits, data, base_offset=0x8c010000):
+    """njPrint/njPrintColor as RAM addresses plus the base color, in the dict
+    layout the editor uses for its settings."""
+    found = {}
+    hit = first_hit(hits, 'njprint')
+    if hit:
+        found['njprint'] = f"0x{hit.offset + base_offset:08x}"
+    hit = first_hit(hits, 'njprint_color')
+    if hit:
+        found['njprint_color'] = f"0x{hit.offset + base_offset:08x}"
+        color_offset = hit.offset + BASE_COLOR_OFFSETS[hit.variant]
+        if color_offset + 4 <= len(data):
+            color_val = struct.unpack('<I', data[color_offset:color_offset + 4])[0]
+            found['base_color_argb'] = f"{color_val:08x}"
+    return found
+
+
+def scan_executable(filepath, base_offset=0x8c010000):
+    data = open_map(filepath)
+    if data is None:
+        return {}
+    with data:
+        return summarize(scan_buffer(data), data, base_offset)
+
+
+BINARY_EXTENSIONS = ('.bin', '.ovl')
+
+
+def scan_report(filepath, base_offset=0x8c010000):
+    """Scan one file for the batch report: njPrint / njPrintColor offsets and
+    variants, base color, font fix variant and every raw hit."""
+    report = {'file': str(filepath)}
+    try:
+        data = open_map(filepath)
+        if data is None:
+            report['hits'] = []
+            return report
+        with data:
+            hits = scan_buffer(data)
+            report.update(summarize(hits, data, base_offset))
+    except (OSError, ValueError) as e:
+        report['error'] = str(e)
+        return report
+
+    for kind in ('njprint', 'njprint_color', 'font_fix'):
+        hit = first_hit(hits, kind)
+        if hit:
+            report[f'{kind}_variant'] = hit.variant
+            report[f'{kind}_file_offset'] = f"0x{hit.offset:x}"
+    report['hits'] = [{'kind': h.kind, 'variant': h.variant, 'file_offset': f"0x{h.offset:x}"} for h in hits]
+    return report
+
+
+def find_binaries(root, extensions=BINARY_EXTENSIONS):
+    """Every file under `root` (an extracted disc tree) with one of `extensions`."""
+    extensions = tuple(ext.lower() for ext in extensions)
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(extensions):
+                found.append(os.path.join(dirpath, name))
+    return found
+
+
+def batch_scan(paths, base_offset=0x8c010000, workers=None, extensions=BINARY_EXTENSIONS):
+    """Scan files and directory trees across a process pool; reports keep input order."""
+    files = []
+    for path in paths:
+        files.extend(find_binaries(path, extensions) if os.path.isdir(path) else [path])
+    if len(files) <= 1 or workers == 1:
+        return [scan_report(f, base_offset) for f in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(scan_report, files, [base_offset] * len(files), chunksize=4))
+
+
+REPORT_COLUMNS = ['file', 'njprint', 'njprint_variant', 'njprint_color', 'njprint_color_variant',
+                  'base_color_argb', 'font_fix_variant', 'hits', 'error']
+
+
+def write_report(reports, f, fmt='json'):
+    if fmt == 'json':
+        json.dump(reports, f, indent=2)
+        f.write('\n')
+        return
+    writer = csv.DictWriter(f, fieldnames=REPORT_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for report in reports:
+        row = dict(report)
+        row['hits'] = len(report.get('hits', []))
+        writer.writerow(row)
+
+
+def _fill_runs(data, fill, min_size):
+    """(start, end) of every run of `fill` bytes at least `min_size` long."""
+    if np is not None:
+        arr = np.frombuffer(data, dtype=np.uint8)
+        edges = np.diff(np.concatenate(([False], arr == fill, [False])).view(np.int8))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        keep = (ends - starts) >= min_size
+        runs = list(zip(starts[keep].tolist(), ends[keep].tolist()))
+        del arr, edges
+        return runs
+    regex = re.compile(re.escape(bytes([fill])) + b'{%d,}' % min_size)
+    return [m.span() for m in regex.finditer(data)]
+
+
+def find_free_space(data, min_size=256, fills=(0x00, 0xFF), guard=4, align=4):
+    """Padding runs that could hold the subtitle blob, best first.
+
+    The first `guard` bytes of a run are skipped (a 0x00 run usually starts with
+    the terminator of the string before it) and the start is aligned to `align`.
+    Runs are ranked by usable size, then by the alignment of their start."""
+    candidates = []
+    for fill in fills:
+        for start, end in _fill_runs(data, fill, min_size):
+            offset = -(-(start + guard) // align) * align
+            if end - offset >= min_size:
+                candidates.append(FreeSpace(offset, end - offset, fill))
+    candidates.sort(key=lambda c: (-c.length, -(c.offset & -c.offset if c.offset else 1 << 32), c.offset))
+    return candidates
+
+
+def scan_free_space(filepath, min_size=256):
+    data = open_map(filepath)
+    if data is None:
+        return []
+    with data:
+        return find_free_space(data, min_size)
@@ -0,0 +1,225 @@
+""" - NINJASUBS SH4 assembler -
+A small two-pass assembler for the subset of SH4 used by the NJ_SUBS runtimes.
+It reads the syntax of njsubs.asm: labels, `;` comments, immediates with or
+without `#`, `mov.l @LABEL,rn` PC-relative loads, `#data` and `#align4`, plus
+`#if NAME` / `#if !NAME` / `#else` / `#endif` blocks switched by `defines`. """
+
+import re
+import struct
+
+
+class AsmError(ValueError):
+    pass
+
+
+_TOKENS = {
+    'RN': r'r(?P<n>1[0-5]|[0-9])',
+    'RM': r'r(?P<m>1[0-5]|[0-9])',
+    'IMM': r'#?(?P<i>[-+]?[\w.]+)',
+}
+_INSTRUCTIONS = {}
+
+
+def _op(mnemonic, operands, encode):
+    pattern = re.escape(operands)
+    for token, regex in _TOKENS.items():
+        pattern = pattern.replace(token, regex)
+    _INSTRUCTIONS.setdefault(mnemonic, []).append((re.compile(pattern + '$'), encode))
+
+
+def _rr(base):
+    return lambda n, m: base | (n << 8) | (m << 4)
+
+
+def _r(base):
+    return lambda n: base | (n << 8)
+
+
+def _imm8(value):
+    if not -128 <= value <= 255:
+        raise AsmError(f"immediate {value} out of range")
+    return value & 0xFF
+
+
+def _disp(value, scale, bits):
+    if value % scale or not 0 <= value // scale < (1 << bits):
+        raise AsmError(f"displacement {value} out of range")
+    return value // scale
+
+
+for _name, _base in [('mov', 0x6003), ('add', 0x300C), ('addc', 0x300E), ('sub', 0x3008), ('and', 0x2009),
+                     ('or', 0x200B), ('xor', 0x200A), ('tst', 0x2008), ('not', 0x6007), ('neg', 0x600B),
+                     ('cmp/eq', 0x3000), ('cmp/hs', 0x3002), ('cmp/ge', 0x3003), ('cmp/hi', 0x3006),
+                     ('cmp/gt', 0x3007), ('extu.b', 0x600C), ('extu.w', 0x600D), ('exts.b', 0x600E),
+                     ('exts.w', 0x600F), ('swap.b', 0x6008), ('swap.w', 0x6009), ('shld', 0x400D),
+                     ('shad', 0x400C), ('mul.l', 0x0007), ('mulu.w', 0x200E), ('muls.w', 0x200F)]:
+    _op(_name, 'RM,RN', _rr(_base))
+
+for _name, _base in [('shll', 0x4000), ('shlr', 0x4001), ('shll2', 0x4008), ('shlr2', 0x4009),
+                     ('shll8', 0x4018), ('shlr8', 0x4019), ('shll16', 0x4028), ('shlr16', 0x4029),
+                     ('shal', 0x4020), ('shar', 0x4021), ('rotl', 0x4004), ('rotr', 0x4005),
+                     ('dt', 0x4010), ('cmp/pz', 0x4011), ('cmp/pl', 0x4015), ('movt', 0x0029)]:
+    _op(_name, 'RN', _r(_base))
+
+_op('jmp', '@RN', _r(0x402B))
+_op('jsr', '@RN', _r(0x400B))
+_op('sts', 'macl,RN', _r(0x001A))
+_op('sts', 'pr,RN', _r(0x002A))
+_op('lds', 'RN,pr', _r(0x402A))
+_op('sts.l', 'pr,@-RN', _r(0x4022))
+_op('lds.l', '@RN+,pr', _r(0x4026))
+
+for _name, _code in [('rts', 0x000B), ('nop', 0x0009), ('clrt', 0x0008), ('sett', 0x0018)]:
+    _op(_name, '', lambda _c=_code: _c)
+
+for _size, _low in [('b', 0), ('w', 1), ('l', 2)]:
+    _op(f'mov.{_size}', 'RM,@RN', _rr(0x2000 | _low))
+    _op(f'mov.{_size}', '@RM,RN', _rr(0x6000 | _low))
+    _op(f'mov.{_size}', 'RM,@-RN', _rr(0x2004 | _low))
+    _op(f'mov.{_size}', '@RM+,RN', _rr(0x6004 | _low))
+    _op(f'mov.{_size}', 'RM,@(r0,RN)', _rr(0x0004 | _low))
+    _op(f'mov.{_size}', '@(r0,RM),RN', _rr(0x000C | _low))
+
+_op('mov', 'IMM,RN', lambda n, i: 0xE000 | (n << 8) | _imm8(i))
+_op('add', 'IMM,RN', lambda n, i: 0x7000 | (n << 8) | _imm8(i))
+_op('cmp/eq', 'IMM,r0', lambda i: 0x8800 | _imm8(i))
+_op('and', 'IMM,r0', lambda i: 0xC900 | _imm8(i))
+_op('or', 'IMM,r0', lambda i: 0xCB00 | _imm8(i))
+_op('xor', 'IMM,r0', lambda i: 0xCA00 | _imm8(i))
+_op('tst', 'IMM,r0', lambda i: 0xC800 | _imm8(i))
+_op('mov.b', 'r0,@(IMM,RN)', lambda n, i: 0x8000 | (n << 4) | _disp(i, 1, 4))
+_op('mov.w', 'r0,@(IMM,RN)', lambda n, i: 0x8100 | (n << 4) | _disp(i, 2, 4))
+_op('mov.l', 'RM,@(IMM,RN)', lambda n, m, i: 0x1000 | (n << 8) | (m << 4) | _disp(i, 4, 4))
+_op('mov.b', '@(IMM,RM),r0', lambda m, i: 0x8400 | (m << 4) | _disp(i, 1, 4))
+_op('mov.w', '@(IMM,RM),r0', lambda m, i: 0x8500 | (m << 4) | _disp(i, 2, 4))
+_op('mov.l', '@(IMM,RM),RN', lambda n, m, i: 0x5000 | (n << 8) | (m << 4) | _disp(i, 4, 4))
+
+# PC-relative loads take a label and are resolved against the instruction address.
+_LABEL = r'(?P<label>(?!r(?:1[0-5]|[0-9])\b)[a-z_][\w.]*)'
+_PC_RELATIVE = {
+    'mov.l': (re.compile('@' + _LABEL + ',' + _TOKENS['RN'] + '$'), 0xD000, 4),
+    'mov.w': (re.compile('@' + _LABEL + ',' + _TOKENS['RN'] + '$'), 0x9000, 2),
+    'mova': (re.compile('@?' + _LABEL + ',r0$'), 0xC700, 4),
+}
+_BRANCHES = {'bra': (0xA000, 12), 'bsr': (0xB000, 12), 'bt': (0x8900, 8), 'bf': (0x8B00, 8),
+             'bt/s': (0x8D00, 8), 'bf/s': (0x8F00, 8), 'bt.s': (0x8D00, 8), 'bf.s': (0x8F00, 8)}
+
+
+def _value(token, symbols):
+    if re.match(r'[-+]?(0x[0-9a-f]+|[0-9]+)$', token):
+        return int(token, 0)
+    if token in symbols:
+        return symbols[token]
+    raise AsmError(f"unknown symbol '{token}'")
+
+
+def _encode(name, args, address, symbols):
+    if name in _BRANCHES:
+        base, bits = _BRANCHES[name]
+        disp = _value(args, symbols) - (address + 4)
+        if disp % 2 or not -(1 << (bits - 1)) <= disp // 2 < (1 << (bits - 1)):
+            raise AsmError(f"branch target out of range ({disp})")
+        return base | ((disp // 2) & ((1 << bits) - 1))
+
+    if name in _PC_RELATIVE:
+        pattern, base, scale = _PC_RELATIVE[name]
+        m = pattern.match(args)
+        if m:
+            pc = (address + 4) & ~3 if scale == 4 else address + 4
+            reg = int(m.group('n')) if 'n' in m.groupdict() else 0
+            return base | (reg << 8) | _disp(_value(m.group('label'), symbols) - pc, scale, 8)
+
+    for pattern, encode in _INSTRUCTIONS.get(name, []):
+        m = pattern.match(args)
+        if m:
+            values = {k: int(v) if k in 'nm' else _value(v, symbols) for k, v in m.groupdict().items()}
+            return encode(**values)
+    raise AsmError("unsupported instruction")
+
+
+def _data_items(args):
+    return re.findall(r'"(?:[^"\\]|\\.)*"|[^\s,]+', args)
+
+
+def _data_bytes(token, symbols):
+    if token.startswith('"'):
+        return token[1:-1].encode('utf-8').decode('unicode_escape').encode('latin-1')
+    token = token.lower()
+    # Hex literals are sized by their digits (0x00 byte, 0x0000 half, else word).
+    size = 4
+    if re.match(r'0x[0-9a-f]+$', token):
+        size = 1 if len(token) <= 4 else 2 if len(token) <= 6 else 4
+    value = _value(token, symbols) if symbols is not None else 0
+    return struct.pack({1: '<B', 2: '<H', 4: '<I'}[size], value & ((1 << (size * 8)) - 1))
+
+
+def _lines(source):
+    for line_no, raw in enumerate(source.splitlines(), 1):
+        line = raw.split(';', 1)[0].strip()
+        m = re.match(r'([A-Za-z_][\w.]*):\s*(.*)$', line)
+        if m:
+            yield line_no, 'label', m.group(1).lower(), ''
+            line = m.group(2)
+        if not line:
+            continue
+        head, _, args = line.partition(' ')
+        if head.startswith('#'):
+            yield line_no, 'directive', head.lower(), args.strip()
+        else:
+            yield line_no, 'insn', head.lower(), re.sub(r'\s+', '', args).lower()
+
+
+def _pass(source, origin, symbols, labels, defines):
+    """One assembler pass. With symbols=None only sizes and labels are computed."""
+    out = bytearray()
+    active = [True]
+    for line_no, kind, name, args in _lines(source):
+        try:
+            if name == '#if':
+                negate = args.startswith('!')
+                active.append(active[-1] and ((args.lstrip('!').lower() in defines) != negate))
+                continue
+            if name in ('#else', '#endif'):
+                if len(active) == 1:
+                    raise AsmError(f"{name} without #if")
+                cond = active.pop()
+                if name == '#else':
+                    active.append(active[-1] and not cond)
+                continue
+            if not active[-1]:
+                continue
+            if kind == 'label':
+                labels[name] = origin + len(out)
+            elif name == '#align4':
+                out.extend(bytes((4 - len(out) % 4) % 4))
+            elif name == '#align2':
+                out.extend(bytes(len(out) % 2))
+            elif name == '#data':
+                for token in _data_items(args):
+                    out.extend(_data_bytes(token, symbols))
+            elif kind == 'directive':
+                raise AsmError(f"unknown directive {name}")
+            elif len(out) % 2:
+                raise AsmError("instruction at odd address")
+            else:
+                opcode = 0 if symbols is None else _encode(name, args, origin + len(out), symbols)
+                out.extend(struct.pack('<H', opcode))
+        except AsmError as e:
+            raise AsmError(f"line {line_no}: {name} {args}: {e}") from None
+    if len(active) != 1:
+        raise AsmError("#if without #endif")
+    return out
+
+
+def assemble(source, origin=0, symbols=None, defines=()):
+    """Assemble `source` placed at address `origin`; returns (code, labels).
+
+    `symbols` supplies names the source uses but does not define, such as
+    table addresses only known once the compiler has laid out the blob.
+    `defines` names the `#if` flags that are set."""
+    labels = {}
+    defines = {d.lower() for d in defines}
+    _pass(source, origin, None, labels, defines)
+    known = {k.lower(): v for k, v in (symbols or {}).items()}
+    known.update(labels)
+    return bytes(_pass(source, origin, known, {}, defines)), labels
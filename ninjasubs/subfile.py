@@ -0,0 +1,251 @@
+""" - NINJASUBS subtitle files -
+Streaming readers for SRT, WebVTT and ASS/SSA scripts. Files are read line by
+line and cues are yielded as they complete, so long fan scripts never sit in
+memory as one string. BOMs and CRLF / CR line ends are accepted, and anything
+skipped is reported as a Diagnostic(line, message) instead of being dropped
+silently. Markup the game cannot print (<i>, {\\an8}, ...) is removed. """
+
+import json
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+Cue = namedtuple('Cue', ['start', 'end', 'text', 'line'])
+Diagnostic = namedtuple('Diagnostic', ['line', 'message'])
+
+FORMATS = ('srt', 'vtt', 'ass')
+EXTENSIONS = {'.srt': 'srt', '.vtt': 'vtt', '.ass': 'ass', '.ssa': 'ass'}
+
+# SRT "01:02:03,456 --> ...", WebVTT also "02:03.456 --> ... align:start"
+_TIMING = re.compile(r'\s*(?:(\d+):)?(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*'
+                     r'(?:(\d+):)?(\d{1,2}):(\d{1,2})[,.](\d{1,3})(?:\s.*)?$')
+_ASS_TIME = re.compile(r'\s*(\d+):(\d{1,2}):(\d{1,2})[.:](\d{1,3})\s*$')
+_TAG = re.compile(r'</?[a-zA-Z][^>]*>|<\d[^>]*>')
+_ASS_OVERRIDE = re.compile(r'\{[^}]*\}')
+_ENTITIES = (('&lt;', '<'), ('&gt;', '>'), ('&nbsp;', ' '), ('&lrm;', ''), ('&rlm;', ''), ('&amp;', '&'))
+# WebVTT blocks that are not cues
+_VTT_SKIP = ('WEBVTT', 'NOTE', 'STYLE', 'REGION')
+
+
+def detect_format(path, first_line=''):
+    fmt = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt:
+        return fmt
+    first_line = first_line.lstrip('\ufeff').strip()
+    if first_line.startswith('WEBVTT'):
+        return 'vtt'
+    if first_line.lower() == '[script info]':
+        return 'ass'
+    return 'srt'
+
+
+def _ms(h, m, s, frac):
+    return ((int(h or 0) * 60 + int(m)) * 60 + int(s)) * 1000 + int(frac.ljust(3, '0'))
+
+
+def _clean_markup(text):
+    text = _TAG.sub('', text)
+    for entity, char in _ENTITIES:
+        text = text.replace(entity, char)
+    return text
+
+
+def _finish(start, end, text_lines, line, diagnostics):
+    text = '\n'.join(text_lines).strip()
+    if not text:
+        diagnostics.append(Diagnostic(line, "cue has no text, skipped"))
+        return None
+    if end <= start:
+        diagnostics.append(Diagnostic(line, "cue ends before it starts, skipped"))
+        return None
+    return Cue(start, end, text, line)
+
+
+def iter_blocks(lines, fmt='srt', diagnostics=None):
+    """Cues of an SRT or WebVTT stream. Cue numbers / identifiers are optional,
+    and a timing line directly after the text starts a new cue."""
+    diagnostics = [] if diagnostics is None else diagnostics
+    cue = None
+    skipping = False
+    for lineno, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if lineno == 1:
+            line = line.lstrip('\ufeff')
+        blank = not line.strip()
+        m = _TIMING.match(line)
+        if cue is not None:
+            if blank or m:
+                if m:
+                    diagnostics.append(Diagnostic(lineno, "missing blank line before cue"))
+                    # The line above is this cue's number, not text of the previous one
+                    if cue[2] and cue[2][-1].strip().isdigit():
+                        cue[2].pop()
+                done = _finish(*cue, diagnostics)
+                cue = None
+                if done:
+                    yield done
+            if not blank and not m:
+                cue[2].append(_clean_markup(line))
+        if m:
+            start = _ms(*m.group(1, 2, 3, 4))
+            end = _ms(*m.group(5, 6, 7, 8))
+            cue = (start, end, [], lineno)
+            skipping = False
+        elif blank:
+            skipping = False
+        elif cue is None and not skipping:
+            if fmt == 'vtt' and line.startswith(_VTT_SKIP):
+                skipping = True
+            elif '-->' in line:
+                diagnostics.append(Diagnostic(lineno, f"bad timing line: {line.strip()}"))
+                skipping = True
+            elif not line.strip().isdigit() and fmt == 'srt':
+                diagnostics.append(Diagnostic(lineno, f"text outside a cue, skipped: {line.strip()[:40]}"))
+    if cue is not None:
+        done = _finish(*cue, diagnostics)
+        if done:
+            yield done
+
+
+def iter_ass(lines, diagnostics=None):
+    """Dialogue events of an ASS/SSA script, in file order."""
+    diagnostics = [] if diagnostics is None else diagnostics
+    section = None
+    fields = None
+    for lineno, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if lineno == 1:
+            line = line.lstrip('\ufeff')
+        stripped = line.strip()
+        if stripped.startswith('[') and stripped.endswith(']'):
+            section = stripped.lower()
+            continue
+        if section != '[events]' or ':' not in stripped:
+            continue
+        kind, rest = stripped.split(':', 1)
+        if kind == 'Format':
+            fields = [f.strip().lower() for f in rest.split(',')]
+            continue
+        if kind != 'Dialogue':
+            continue
+        if fields is None:
+            diagnostics.append(Diagnostic(lineno, "Dialogue before the Format line, skipped"))
+            continue
+        values = rest.lstrip().split(',', len(fields) - 1)
+        if len(values) != len(fields):
+            diagnostics.append(Diagnostic(lineno, "Dialogue has too few fields, skipped"))
+            continue
+        event = dict(zip(fields, values))
+        start = _ASS_TIME.match(event.get('start', ''))
+        end = _ASS_TIME.match(event.get('end', ''))
+        if not start or not end:
+            diagnostics.append(Diagnostic(lineno, "bad Dialogue time, skipped"))
+            continue
+        # h:mm:ss.cc - centiseconds
+        start = _ms(start.group(1), start.group(2), start.group(3), start.group(4).ljust(2, '0'))
+        end = _ms(end.group(1), end.group(2), end.group(3), end.group(4).ljust(2, '0'))
+        text = _ASS_OVERRIDE.sub('', event.get('text', ''))
+        text = text.replace('\\N', '\n').replace('\\n', '\n').replace('\\h', ' ')
+        done = _finish(start, end, [text], lineno, diagnostics)
+        if done:
+            yield done
+
+
+def iter_cues(lines, fmt='srt', diagnostics=None):
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown subtitle format: {fmt}")
+    if fmt == 'ass':
+        return iter_ass(lines, diagnostics)
+    return iter_blocks(lines, fmt, diagnostics)
+
+
+def read_cues(path, fmt=None, diagnostics=None):
+    """Yield the cues of a subtitle file, detecting the format from the
+    extension (or the first line) when `fmt` is None."""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        if fmt is None:
+            first = f.readline()
+            fmt = detect_format(path, first)
+            f.seek(0)
+        yield from iter_cues(f, fmt, diagnostics)
+
+
+# Bulk import: map each file of a directory to a scene with (regex, scene, name)
+# rules. Scene numbers are 1-based as shown in the editor; a rule without one
+# takes the `scene` group of its pattern, and the name defaults to the `name`
+# group or the file name.
+SceneFile = namedtuple('SceneFile', ['path', 'scene', 'name'])
+ImportResult = namedtuple('ImportResult', ['path', 'scene', 'name', 'cues', 'diagnostics', 'error'])
+
+MAPPING_FILE = 'scenes.json'
+# Default: the first number in the file name is the scene number
+DEFAULT_RULES = [(r'\D*(?P<scene>\d+).*', None, None)]
+
+
+def load_mapping(path):
+    """Rules from a JSON list of {"pattern": regex, "scene": number, "name": text}."""
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    rules = []
+    for entry in entries:
+        re.compile(entry['pattern'])
+        rules.append((entry['pattern'], entry.get('scene'), entry.get('name')))
+    return rules
+
+
+def map_files(directory, rules=None):
+    """Match the subtitle files in `directory` against `rules`. Returns
+    (files, skipped) with skipped as (path, reason) pairs."""
+    rules = DEFAULT_RULES if rules is None else rules
+    compiled = [(re.compile(pattern, re.IGNORECASE), scene, name) for pattern, scene, name in rules]
+    files = []
+    skipped = []
+    taken = {}
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if os.path.splitext(filename)[1].lower() not in EXTENSIONS or not os.path.isfile(path):
+            continue
+        for pattern, scene, name in compiled:
+            m = pattern.fullmatch(filename)
+            if not m:
+                continue
+            groups = m.groupdict()
+            if scene is None:
+                scene = groups.get('scene')
+            if scene is None:
+                continue
+            scene = int(scene) - 1
+            if name is None:
+                name = groups.get('name') or os.path.splitext(filename)[0]
+            break
+        else:
+            skipped.append((path, "no mapping rule matches"))
+            continue
+        if scene < 0:
+            skipped.append((path, "scene numbers start at 1"))
+        elif scene in taken:
+            skipped.append((path, f"scene {scene + 1} already comes from {os.path.basename(taken[scene])}"))
+        else:
+            taken[scene] = path
+            files.append(SceneFile(path, scene, name))
+    return files, skipped
+
+
+def read_scene_file(scene_file):
+    diagnostics = []
+    try:
+        cues = list(read_cues(scene_file.path, diagnostics=diagnostics))
+        error = None
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        cues = []
+        error = str(e)
+    return ImportResult(scene_file.path, scene_file.scene, scene_file.name, cues, diagnostics, error)
+
+
+def bulk_read(files, workers=None):
+    """Parse SceneFiles across a process pool; results keep input order."""
+    if len(files) <= 1 or workers == 1:
+        return [read_scene_file(f) for f in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(read_scene_file, files, chunksize=4))
@@ -0,0 +1,85 @@
+""" - NINJASUBS text pool -
+Builds the SUBS_TEXT area. Strings are packed without alignment and a string
+that is the tail of a longer one points into it instead of being stored again.
+Optionally texts are byte-pair coded first: byte values no text uses become
+codes for a pair of bytes (or codes), expanded again by the runtime. """
+
+from collections import Counter
+
+# Pairs nest at most this deep, bounding the runtime's expansion stack (4 bytes per level).
+MAX_PAIR_DEPTH = 12
+
+
+def build_pool(texts):
+    """Pack `texts` (bytes, no terminator) into one NUL-terminated pool with
+    shared suffixes. Returns (pool, offsets) with offsets[i] for texts[i]."""
+    order = sorted(range(len(texts)), key=lambda i: texts[i][::-1], reverse=True)
+    pool = bytearray()
+    offsets = [0] * len(texts)
+    host = None
+    for i in order:
+        # Reverse-sorted descending, each string follows the strings it is a tail of.
+        if host is not None and texts[host].endswith(texts[i]):
+            offsets[i] = offsets[host] + len(texts[host]) - len(texts[i])
+            continue
+        host = i
+        offsets[i] = len(pool)
+        pool.extend(texts[i] + b'\x00')
+    return bytes(pool), offsets
+
+
+def _replace_pair(seq, pair, code):
+    out = []
+    i = 0
+    while i < len(seq):
+        if i + 1 < len(seq) and seq[i] == pair[0] and seq[i + 1] == pair[1]:
+            out.append(code)
+            i += 2
+        else:
+            out.append(seq[i])
+            i += 1
+    return out
+
+
+def byte_pair_encode(texts):
+    """Byte-pair code `texts`. Returns (first_code, pairs, encoded texts): code
+    first_code + n expands to pairs[n], two bytes that may be codes themselves.
+    NUL never becomes a code, since the runtime looks for it."""
+    used = set(b'\x00')
+    for text in texts:
+        used.update(text)
+    first_code = max(used) + 1
+    seqs = [list(text) for text in texts]
+    pairs = []
+    depth = {}
+    while first_code + len(pairs) <= 0xFF:
+        counts = Counter()
+        for seq in seqs:
+            counts.update(zip(seq, seq[1:]))
+        best = None
+        for pair, count in counts.most_common():
+            # A pair costs 2 bytes in the table, each use saves 1.
+            if count < 3:
+                break
+            if 1 + max(depth.get(pair[0], 0), depth.get(pair[1], 0)) <= MAX_PAIR_DEPTH:
+                best = pair
+                break
+        if best is None:
+            break
+        code = first_code + len(pairs)
+        pairs.append(best)
+        depth[code] = 1 + max(depth.get(best[0], 0), depth.get(best[1], 0))
+        seqs = [_replace_pair(seq, best, code) if len(seq) > 1 else seq for seq in seqs]
+    return first_code, pairs, [bytes(seq) for seq in seqs]
+
+
+def byte_pair_decode(data, first_code, pairs):
+    out = bytearray()
+    stack = list(reversed(data))
+    while stack:
+        b = stack.pop()
+        if b >= first_code:
+            stack.extend(reversed(pairs[b - first_code]))
+        else:
+            out.append(b)
+    return bytes(out)
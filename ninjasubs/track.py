@@ -0,0 +1,139 @@
+""" - NINJASUBS subtitle track -
+The editor's per-scene subtitle list. Entries keep a stable id for the whole
+session, so tree rows and selections survive reordering, and the track stays
+sorted by start time with bisect-based insert, move and remove. Entries also
+answer sub['start'] / sub.get('color', ...) like the plain dicts of a loaded
+project, so the compiler takes either. """
+
+import itertools
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
+
+FIELDS = ('start', 'end', 'text', 'x', 'y', 'color', 'opacity', 'auto_center')
+
+_ids = itertools.count(1)
+
+
+class Subtitle:
+    __slots__ = ('id',) + FIELDS
+
+    def __init__(self, start=0, end=1000, text='', x=0, y=0, color='ffbfbfbf', opacity=255, auto_center=True):
+        self.id = next(_ids)
+        self.start = start
+        self.end = end
+        self.text = text
+        self.x = x
+        self.y = y
+        self.color = color
+        self.opacity = opacity
+        self.auto_center = auto_center
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**{k: d[k] for k in FIELDS if k in d})
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in FIELDS}
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        # Changing 'start' this way leaves the track unsorted, use SubtitleTrack.move
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def update(self, fields):
+        for key, value in fields.items():
+            setattr(self, key, value)
+
+    def __repr__(self):
+        return f"Subtitle(id={self.id}, start={self.start}, end={self.end}, text={self.text!r})"
+
+
+class SubtitleTrack:
+    """Subtitles of one scene, sorted by start time. Equal starts keep their
+    insertion order, matching a stable sort of the old plain list."""
+
+    def __init__(self, subs=()):
+        self._subs = []
+        self._starts = []
+        self._by_id = {}
+        self.extend(subs)
+
+    def __len__(self):
+        return len(self._subs)
+
+    def __iter__(self):
+        return iter(self._subs)
+
+    def __getitem__(self, idx):
+        return self._subs[idx]
+
+    def __contains__(self, sub):
+        return self._by_id.get(getattr(sub, 'id', None)) is sub
+
+    def by_id(self, sub_id):
+        """Entry with this id, or None if it is not in the track."""
+        return self._by_id.get(sub_id)
+
+    def index(self, sub):
+        idx = bisect_left(self._starts, sub.start)
+        while self._subs[idx] is not sub:
+            idx += 1
+        return idx
+
+    def insert(self, sub):
+        """Add a Subtitle (or a project dict) after the entries starting at or before it; returns its index."""
+        if not isinstance(sub, Subtitle):
+            sub = Subtitle.from_dict(sub)
+        idx = bisect_right(self._starts, sub.start)
+        self._subs.insert(idx, sub)
+        self._starts.insert(idx, sub.start)
+        self._by_id[sub.id] = sub
+        return idx
+
+    def extend(self, subs):
+        """Bulk add, sorting once instead of bisecting per entry."""
+        for sub in subs:
+            if not isinstance(sub, Subtitle):
+                sub = Subtitle.from_dict(sub)
+            self._subs.append(sub)
+            self._by_id[sub.id] = sub
+        self._subs.sort(key=attrgetter('start'))
+        self._starts = [sub.start for sub in self._subs]
+
+    def move(self, sub, start):
+        """Change sub's start time and re-place it where a stable sort would; returns its new index."""
+        idx = self.index(sub)
+        old = sub.start
+        sub.start = start
+        if start == old:
+            return idx
+        del self._subs[idx]
+        del self._starts[idx]
+        if start < old:
+            idx = bisect_right(self._starts, start, 0, idx)
+        else:
+            idx = bisect_left(self._starts, start, idx)
+        self._subs.insert(idx, sub)
+        self._starts.insert(idx, start)
+        return idx
+
+    def remove(self, sub):
+        """Remove sub; returns the index it had."""
+        idx = self.index(sub)
+        del self._subs[idx]
+        del self._starts[idx]
+        del self._by_id[sub.id]
+        return idx
+
+    def clear(self):
+        self._subs = []
+        self._starts = []
+        self._by_id = {}
+
+    def to_dicts(self):
+        return [sub.to_dict() for sub in self._subs]
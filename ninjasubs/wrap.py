@@ -0,0 +1,105 @@
+""" - NINJASUBS line wrapping -
+Re-flows subtitle text into njPrint lines of at most `width` UTF-8 bytes with
+minimum raggedness: the sum of squared free space over every line but the
+last is as small as possible, so lines come out evenly filled instead of
+greedily packed. A text whose lines all fit is left as written. Otherwise
+line breaks are treated as spaces, except before a line starting with '-' (a
+change of speaker), which always starts a new line, and blank lines, which
+are kept as paragraph breaks. """
+
+from .runtime import DEFAULT_LINE_WIDTH
+
+
+def centered_x(line, width=DEFAULT_LINE_WIDTH):
+    """X AUTO-X centering gives a line, as the compiler stores it for the runtime."""
+    return max(0, ((width - len(line.encode('utf-8'))) // 2) + 2)
+
+
+def overlong_lines(text, width=DEFAULT_LINE_WIDTH):
+    """(line number, byte length) of each line longer than `width`."""
+    return [(i, len(line.encode('utf-8'))) for i, line in enumerate(text.split('\n'), 1)
+            if len(line.encode('utf-8')) > width]
+
+
+def _split_word(word, width):
+    """Cut a word longer than a line into pieces, never inside a UTF-8 sequence."""
+    pieces = []
+    piece = ''
+    size = 0
+    for char in word:
+        n = len(char.encode('utf-8'))
+        if size + n > width and piece:
+            pieces.append(piece)
+            piece, size = '', 0
+        piece += char
+        size += n
+    if piece:
+        pieces.append(piece)
+    return pieces
+
+
+def _wrap_words(words, width):
+    sizes = [len(word.encode('utf-8')) for word in words]
+    n = len(words)
+    # cost[i]: best cost of setting words[i:]; brk[i]: end of the first line
+    cost = [0] * (n + 1)
+    brk = [n] * (n + 1)
+    for i in range(n - 1, -1, -1):
+        best = None
+        used = -1
+        for j in range(i + 1, n + 1):
+            used += sizes[j - 1] + 1
+            if used > width and j > i + 1:
+                break
+            c = cost[j] + (0 if j == n else (width - used) ** 2)
+            if best is None or c < best:
+                best, brk[i] = c, j
+        cost[i] = best
+    lines = []
+    i = 0
+    while i < n:
+        lines.append(' '.join(words[i:brk[i]]))
+        i = brk[i]
+    return lines
+
+
+def wrap_text(text, width=DEFAULT_LINE_WIDTH):
+    if not overlong_lines(text, width):
+        return text
+    # Lists of words; None is a blank line, kept as it is
+    paragraphs = []
+    for line in text.split('\n'):
+        if not line.strip():
+            paragraphs.append(None)
+            continue
+        if not paragraphs or paragraphs[-1] is None or line.lstrip().startswith('-'):
+            paragraphs.append([])
+        paragraphs[-1].extend(line.split())
+    lines = []
+    for words in paragraphs:
+        if words is None:
+            lines.append('')
+            continue
+        pieces = []
+        for word in words:
+            pieces.extend(_split_word(word, width) if len(word.encode('utf-8')) > width else [word])
+        lines.extend(_wrap_words(pieces, width))
+    return '\n'.join(lines)
+
+
+def wrap_subtitles(subs, width=DEFAULT_LINE_WIDTH):
+    """Re-wrap every subtitle of a scene in place, updating the displayed X of
+    auto-centered ones. Returns how many texts changed."""
+    changed = 0
+    for sub in subs:
+        text = wrap_text(sub['text'], width)
+        if sub.get('auto_center', True):
+            sub['x'] = centered_x(text.split('\n')[0], width)
+        if text != sub['text']:
+            sub['text'] = text
+            changed += 1
+    return changed
+
+
+def wrap_scenes(scenes, width=DEFAULT_LINE_WIDTH):
+    return sum(wrap_subtitles(subs, width) for subs in scenes.values())
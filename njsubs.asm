@@ -3,7 +3,8 @@
 
 ; NJ_SUBS() - Function to display subtitles via njPrint
 ; Parse CURRENT_TIMER to TIME_VALUES table to display SUBTITLES sequence.
-; Features AUTO-X centering when X is 0xFF
+; Texts are split into lines by the compiler: each line is printed as stored,
+; with its precomputed centered X when X is 0xFF (AUTO-X)
 
 NJ_SUBS:
     sts.l     PR,@-r15
@@ -31,151 +32,95 @@ find_current_time:
     bt        advance_sequence          ; If yes, continue the loop
     
     ; Found matching time
-    mov.b     @r3,r1                    ; r1 = read sequence index uint8
+    mov.l     r8,@-r15
+    mov.l     r9,@-r15
+    mov.l     r10,@-r15
+    mov.l     r11,@-r15
+    mov.l     r12,@-r15
 
     ; Save current color to stack
     mov.l     @PTR_CURRENT_COLOR,r7
     mov.l     @r7,r7
     mov.l     r7,@-r15                  ; Push current color value to stack
 
+    ; subID 0xFF: several subs at once, colorID = count, y/x = offset of their entries
+    mov       r3,r12                    ; r12 = sequence entry to draw
+    mov       1,r11                     ; r11 = entries left to draw
+    mov.b     @r12,r0
+    cmp/eq    -1,r0
+    bf        draw_record
+    mov.b     @(0x1,r12),r0
+    extu.b    r0,r11                    ; r11 = number of subs
+    mov.b     @(0x3,r12),r0
+    extu.b    r0,r1
+    shll8     r1
+    mov.b     @(0x2,r12),r0
+    extu.b    r0,r0
+    or        r0,r1                     ; r1 = offset of the sub entries
+    add       r1,r12
+
+draw_record:
+    mov.b     @r12,r1
+    extu.b    r1,r1                     ; r1 = read sequence index uint8
+
     ; Read color
-    mov.b     @(0x1,r3),r0              ; r0 = color index
+    mov.b     @(0x1,r12),r0             ; r0 = color index
+    extu.b    r0,r0
     shll2     r0                        ; color index * 4
     mov.l     @PTR_COLOR_ID_TABLE,r7    ; Read color table ptr
     mov.l     @(r0,r7),r7               ; color value in r7
     mov.l     @PTR_CURRENT_COLOR,r0
     mov.l     r7,@r0                    ; write color value
-    
-    ; Sub offset
-    mov.b     @(0x2,r3),r0              
-    extu.b    r0,r2                     ; r2 = y
-    mov.b     @(0x3,r3),r0              ; r4 = x
-    
+
+    ; Sub offset: line VH = (line word & r10) + r9
+    mov.b     @(0x2,r12),r0
+    extu.b    r0,r9                     ; r9 = y
+    mov.b     @(0x3,r12),r0             ; r0 = x
+
     ; Check if x=0xFF (AUTO-X flag)
     cmp/eq    0xff,r0
-    bf        loc_normal_VH
-    mov       1,r7                      ; if x=FF, set AUTO-X flag to 1
-    mov.l     r7,@-r15                  ; PUSH AUTO-X FLAG TO STACK
-    bra       loc_after_vh_calc
-    mov       0,r4                      ; x = 0 placeholder
-    
-loc_normal_VH:
-    mov       0,r7                      ; AUTO-X flag = 0
-    mov.l     r7,@-r15                  ; PUSH AUTO-X FLAG TO STACK
-    extu.b    r0,r4
-    
+    bt/s      loc_after_vh_calc         ; AUTO-X: keep the centered X of each line
+    mov       -1,r10
+    extu.b    r0,r0
+    shll16    r0
+    or        r0,r9                     ; r9 = x << 16 | y
+    extu.w    r10,r10                   ; keep only the Y offset of each line
+
 loc_after_vh_calc:
-    shll16    r4
-    or        r2,r4                     ; VH offset in r4
-    mov.l     r4,@-r15                  ; SAVE r4 TO STACK
-    
-    ; Allocate 0x28 bytes on stack for text buffer
-    add       -0x28,r15                 ; allocate 0x28 bytes
-    mov       r15,r6                    ; r6 = pointer to buffer start
-    mov       r6,r2                     ; backup pointer for char count in r2
-    shll2     r1                        ; index * 4
     mov.l     @PTR_PTR_SUBS_TEXT,r0     ; r0 = pointer to SUBS_TEXT table
-    add       r0,r1                     ; r3 = final text pointer
-    mov       r1,r3
-    mov.l     @r3,r3
-    
-    ; Initialize char counter
-    mov       0,r8                      ; r8 = char count for current line
-
-copy_loop:
-    mov.b     @r3,r0                    ; load current character
-    add       1,r3                      ; advance text pointer
-    tst       r0,r0
-    bt        final_print               ; if null, done
-
-    cmp/eq    0x0A,r0
-    bt        do_print_line             ; if newline, print line
-
-    mov.b     r0,@r6                    ; copy char to buffer
-    add       1,r6
-    bra       copy_loop
-    add       1,r8                      ; increment char counter
-
-do_print_line:
-    mov       0,r0
-    mov.b     r0,@r6                    ; terminate string in buffer
-    mov.l     r3,@-r15                  ; SAVE ORIGINAL TEXT POINTER
-    mov       r15,r5                    ; r5 = buffer pointer (save it before jsr)
-    add       0x4,r5                    ; r5 += 0x4 to skip TXT_PTR
-  
-    ; Check AUTO-X flag and calculate centered X if needed
-    mov.l     @(0x30,r15),r0            ; load AUTO-X flag from stack 0x30
-    cmp/eq    0,r0
-    bt        loc_continue_print        ; if AUTO-X flag = 0, skip calculation
-    
-    ; Calculate centered X: ((36 - text_len) // 2) + 2
-    mov       36,r0
-    sub       r8,r0                     ; r0 = 36 - char_count
-    shlr      r0                        ; r0 = r0 >> 1 (divide by 2)
-    add       2,r0                      ; r0 += 2
-    
-    ; Update r4 with new centered X
-    mov       r0,r1
-    mov       0x2e,r0                   ; 0x2e (offset to X in VH on stack)
-    mov.b     r1,@(r0,r15)              ; write X directly to stack
-    mov.l     @(0x2c,r15),r4            ; 0x2c (load r4 VH from stack)
-
-loc_continue_print:
+    shll2     r1                        ; index * 4
+    mov.l     @(r0,r1),r8               ; r8 = line table of the text
+
+print_line:
+    mov.l     @r8+,r3                   ; r3 = line text, null after the last line
+    tst       r3,r3
+    bt        lines_done
+    mov.l     @r8+,r4                   ; r4 = centered X << 16 | Y offset
+    and       r10,r4
+    add       r9,r4                     ; r4 = VH of the line
     mov.l     @PTR_NJPRINT,r0
-    jsr       @r0                       ; call _njPrint
-    mov.l     r5,@-r15                  ; PUSH BUFFER POINTER IN DELAY SLOT
-    
-    ; Increase vertical offset AFTER printing
-    mov.l     @(0x30,r15),r4            ; load r4 from stack (buffer 0x28 + TXT_PTR 0x4 + pushed buffer 0x4)
-    add       0x1,r4                    ; increase vertical offset
-    mov.l     r4,@(0x30,r15)            ; write updated r4 back to stack
-
-    ; Restore original text pointer and skip 0x0A
-    mov.l     @r15+,r3                  ; pop buffer pointer
-    mov.l     @r15+,r3                  ; restore r3 (original text pointer)
-    mov       r15,r6                    ; r6 = pointer to buffer on stack
-    bra       copy_loop
-    mov       0,r8                      ; reset char counter for next line
-
-final_print:
-    mov       0,r0
-    mov.b     r0,@r6
-    mov       r15,r3                    ; r3 = buffer pointer on stack
-    
-    ; Check AUTO-X flag for final line
-    mov.l     @(0x2c,r15),r0            ; load AUTO-X flag from stack
-    cmp/eq    0,r0
-    bt        loc_final_print_normal    ; if AUTO-X flag = 0, skip calculation
-    
-    ; Calculate centered X: ((36 - text_len) // 2) + 2
-    mov       36,r0
-    sub       r8,r0                     ; r0 = 36 - char_count
-    shlr      r0                        ; r0 = r0 >> 1 (divide by 2)
-    add       2,r0                      ; r0 += 2
-    
-    ; Update r4 with new centered X
-    mov.l     @(0x28,r15),r4            ; load r4 from stack 
-    extu.w    r4,r7                     ; r7 = lower 16 bits (Y offset)
-    shll16    r0                        ; shift new X to upper 16 bits
-    or        r7,r0                     ; combine X and Y
-    mov.l     r0,@(0x28,r15)            ; write updated r4 back to stack
-
-loc_final_print_normal:
-    mov.l     @(0x28,r15),r4            ; RESTORE r4 FROM STACK
-    mov.l     @PTR_NJPRINT,r0           ; r0 = pointer to _njPrint function
-    jsr       @r0                       ; _njPrint(r3=text, r4=position)
-    mov.l     r3,@-r15                 
-    add       0x4,r15 
+    jsr       @r0                       ; _njPrint(r4=position, text on the stack)
+    mov.l     r3,@-r15                  ; PUSH TEXT POINTER IN DELAY SLOT
+    bra       print_line
+    add       0x4,r15                   ; pop text pointer
+
+lines_done:
+    dt        r11
+    bf/s      draw_record               ; next entry of a 0xFF entry
+    add       0x4,r12
 
     ; Restore color from stack
-    mov.l     @r15+,r7                  
+    mov.l     @r15+,r7
     mov.l     @PTR_CURRENT_COLOR,r0
     mov.l     r7,@r0
 
-    ; Pop  ( AUTO-X flag 0x4 + buffer 0x28 + r4 0x4 )
-    add       0x30,r15
-    lds.l     @r15+,PR                  
-    rts                                 
+    mov.l     @r15+,r12
+    mov.l     @r15+,r11
+    mov.l     @r15+,r10
+    mov.l     @r15+,r9
+    mov.l     @r15+,r8
+    lds.l     @r15+,PR
+    rts
     nop
 
 #align4
@@ -228,6 +173,7 @@ COLORS:
 
 
 ; sequence: subID(uint8), colorID(uint8),y(uint8),x(uint8)
+; subID 0xFF: colorID subs at once, their entries (y | x << 8) bytes ahead
 SEQUENCE_0:
     #data 0x00 0x01 0x19 0xFF
     #data 0x01 0x01 0x19 0xFF
@@ -242,9 +188,11 @@ SEQUENCE_1:
 
 SEQUENCE_2:
     #data 0x00 0x01 0x19 0xFF
-    #data 0x01 0x01 0x19 0xFF
+    #data 0xFF 0x02 0x0C 0x00           ; 2 subs, entries 0x0C bytes ahead
     #data 0x02 0x00 0x19 0xFF
     #data 0x03 0x00 0x19 0xFF
+    #data 0x01 0x01 0x19 0xFF           ; entries of the 0xFF entry
+    #data 0x03 0x00 0x05 0xFF
 
 #align4
 
@@ -278,19 +226,30 @@ TIME_VALUES_2:
 ; SUBS TEXT
 ;-----------
 
-
+; Line tables: per line the line text, then centered X (upper half) and
+; Y offset (lower half); a null pointer ends the table.
 
 ; EMPTY, used for clearing text before next sub
 SUBS_TEXT_0:
-    #data 0x00000000     
-#align4
+    #data 0x00000000
 
 ; SUBS
 SUBS_TEXT_1:
-    #data "This is a test!" 0x00
-#align4
+    #data LINE_1 0x000C0000
+    #data 0x00000000
 SUBS_TEXT_2:
-    #data "Second sub with spacing" 0x0a "new line!"
-#align4
+    #data LINE_2 0x00080000
+    #data LINE_3 0x000F0001
+    #data 0x00000000
 SUBS_TEXT_3:
-    #data "Last one!" 0x00
\ No newline at end of file
+    #data LINE_4 0x000F0000
+    #data 0x00000000
+
+LINE_1:
+    #data "This is a test!" 0x00
+LINE_2:
+    #data "Second sub with spacing" 0x00
+LINE_3:
+    #data "new line!" 0x00
+LINE_4:
+    #data "Last one!" 0x00